@@ -208,6 +208,27 @@ def sanity_check_matlab(parse_results):
              'The MATLAB code uses array operators that may not be translatable')
 
 
+def drop_unreachable_functions(context):
+    '''If the top-level context came from a lazy parse (see MatlabParser),
+    some of its functions have not been parsed yet.  This parses the ones that
+    the code parsed so far refers to, directly or indirectly, and removes the
+    rest, which cannot matter for the conversion.'''
+    functions = context.functions
+    if not functions.pending():
+        return
+    finder = MatlabNameFinder()
+    scopes = [context] + [fcontext for _, fcontext in functions.loaded_items()]
+    while scopes:
+        names = finder.find_names(scopes)
+        scopes = [functions[fname] for fname in functions.pending()
+                  if fname.name in names]
+    unreachable = functions.pending()
+    for fname in unreachable:
+        del functions[fname]
+    context.nodes = [node for node in context.nodes
+                     if not (isinstance(node, FunDef) and node.name in unreachable)]
+
+
 def clean_matlab(context, protected_context):
     '''Remove MATLAB content we would ignore anyway.  This speeds up processing
     and prevents having to do more complicated checks later to figure out if
@@ -900,8 +921,11 @@ def infer_real_names(context, ode_var, underscores):
 def create_raterule_model(parse_results, use_species=True, output_format="sbml",
                           name_vars_after_param=False, add_comments=True):
 
-    # First, gather some initial information.
+    # First, gather some initial information.  If the parser was in lazy
+    # mode, functions that can't be reached from the top of the file are
+    # dropped without being parsed.
     working_context = first_function_context(parse_results)
+    drop_unreachable_functions(parse_results)
     underscores = num_underscores(working_context) + 1
     matlab_func, args = matlab_ode_call(working_context)
 
@@ -1032,18 +1056,30 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
 
 def is_vector(matrix):
     '''Returns True if "matrix" is a single row vector.'''
+    if isinstance(matrix, NumericArray):
+        return matrix.shape[0] == 1
     return (len(matrix.rows) == 1 and len(matrix.rows[0]) >= 1)
 
 
 def vector_length(matrix):
     '''Returns the length of the row or column vector in "matrix".'''
+    if isinstance(matrix, NumericArray):
+        return matrix.shape[1] if is_vector(matrix) else matrix.shape[0]
     return len(matrix.rows[0]) if is_vector(matrix) else len(matrix.rows)
 
 
 def mloop(matrix, func):
     # Calls function 'func' on a row or column of values from the matrix.
     # Note: the argument 'i' is 0-based, not 1-based like Matlab vectors.
+    # A NumericArray is read through its text forms, creating a Number only
+    # for the element being handed to 'func'.
     # FIXME: this only handles 1-D row or column vectors.
+    if isinstance(matrix, NumericArray):
+        texts = matrix.texts
+        step = 1 if is_vector(matrix) else matrix.shape[1]
+        for i in range(0, vector_length(matrix)):
+            func(i, Number(value=texts[i*step]))
+        return
     base = matrix.rows
     if is_vector(matrix):
         for i in range(0, vector_length(matrix)):
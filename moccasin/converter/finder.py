@@ -95,6 +95,38 @@ class MatlabFinder(MatlabNodeVisitor):
                 return
             else:
                 self.visit(node.middle)
+        if hasattr(node, 'operands'):
+            for operand in node.operands:
+                if self._seek_symbol and operand == self._seek_symbol:
+                    self._found.append(self._seek_symbol)
+                    return
+                else:
+                    self.visit(operand)
+
+
+    def visit_BinaryOp(self, node):
+        # Does what visit_Operator() does, but goes down the left operands
+        # without recursing, and then does the right operands from the
+        # bottom up.  The parser nests long sums to the left, so they are
+        # otherwise as deep as they are long.
+        chain = []
+        while True:
+            if node.op in self._seek_operators:
+                self._found.append(node.op)
+                break
+            if self._seek_symbol and node.left == self._seek_symbol:
+                self._found.append(self._seek_symbol)
+                break
+            chain.append(node)
+            if not isinstance(node.left, BinaryOp):
+                self.visit(node.left)
+                break
+            node = node.left
+        for link in reversed(chain):
+            if self._seek_symbol and link.right == self._seek_symbol:
+                self._found.append(self._seek_symbol)
+            else:
+                self.visit(link.right)
 
 
     def visit_If(self, node):
@@ -182,6 +214,13 @@ class MatlabFinder(MatlabNodeVisitor):
                     self.visit(item)
 
 
+    def visit_NumericArray(self, node):
+        # Only numbers in here, and no references to look into.
+        if isinstance(self._seek_symbol, Number) \
+           and self._seek_symbol.value in node.texts:
+            self._found.append(self._seek_symbol)
+
+
     def visit_ArrayRef(self, node):
         if self._seek_symbol and node.name == self._seek_symbol:
             self._found.append(self._seek_symbol)
@@ -234,3 +273,34 @@ class MatlabFinder(MatlabNodeVisitor):
         self._seek_operators = ops
         self.visit(self._context.nodes)
         return self._found
+
+
+class MatlabNameFinder(MatlabNodeVisitor):
+    '''Collects the names used in MatlabNode trees: identifiers, plus strings
+    that could be names given to feval() or str2func().  The names of
+    function definitions are not collected, only what is in their bodies.'''
+
+    def __init__(self):
+        super(MatlabNameFinder, self).__init__()
+        self._names = set()
+
+
+    def visit_Identifier(self, node):
+        self._names.add(node.name)
+        return node
+
+
+    def visit_String(self, node):
+        self._names.add(node.value)
+        return node
+
+
+    def visit_FunDef(self, node):
+        self.visit(node.body)
+        return node
+
+
+    def find_names(self, contexts):
+        for context in contexts:
+            self.visit(context.nodes)
+        return self._names
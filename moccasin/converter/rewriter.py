@@ -105,7 +105,9 @@ class MatlabRewriter(MatlabNodeVisitor):
                             left = UnaryOp(op = '-', operand = Number(value = '1')),
                             right = self.visit(node.operand))
         else:
-            self.visit(node.operand)
+            # Assigned, so that the node forgets its string (the operand
+            # may have been changed in place; see MatlabNode.invalidate()).
+            node.operand = self.visit(node.operand)
             return node
 
 
@@ -135,13 +137,31 @@ class MatlabRewriter(MatlabNodeVisitor):
         return node
 
 
-    def default_visit(self, node):
-        if isinstance(node, BinaryOp) and node.op in _TRANSLATE_EL_BINARYOPS:
-            node.op = _TRANSLATE_EL_BINARYOPS[node.op]
-        for a in type(node)._visitable_attr:
-            value = getattr(node, a, None)
-            if value:
-                setattr(node, a, self.visit(value))
+    def visit_NumericArray(self, node):
+        # The numbers in a NumericArray are not nodes, so they are rewritten
+        # one at a time using visit_Number() on a temporary node.
+        if self.unscientific_numbers:
+            node.texts = [self.visit_Number(Number(value=text)).value
+                          for text in node.texts]
+        return node
+
+
+    def visit_BinaryOp(self, node):
+        # Goes down the left operands without recursing, and then visits
+        # the right operands from the bottom up, as the default visitor
+        # would.  The parser nests long sums to the left, so they are
+        # otherwise as deep as they are long.
+        chain = [node]
+        while isinstance(chain[-1].left, BinaryOp):
+            chain.append(chain[-1].left)
+        for link in chain:
+            if link.op in _TRANSLATE_EL_BINARYOPS:
+                link.op = _TRANSLATE_EL_BINARYOPS[link.op]
+        left = self.visit(chain[-1].left)
+        for link in reversed(chain):
+            link.left = left
+            link.right = self.visit(link.right)
+            left = link
         return node
 
 
@@ -53,16 +53,31 @@ _BIOCHAM_URL = 'http://lifeware.inria.fr/biocham/online/rest/export'
 class Controller():
     '''This class serves to interface between the CLI and GUI.'''
 
-    def __init__(self):
-        self.parser = MatlabParser()
+    def __init__(self, cache=None, packrat=True, workers=1, lazy=False,
+                 memo=None, fast_path=None, profile=None, trace=None,
+                 budget=None, recover=False, flatten=False):
+        self.parser = MatlabParser(cache=cache, packrat=packrat, workers=workers,
+                                   lazy=lazy, memo=memo, fast_path=fast_path,
+                                   profile=profile, trace=trace, budget=budget,
+                                   recover=recover, flatten=flatten)
+        # MatlabParser.reparse() doesn't use the lazy, workers and cache
+        # options, so those mean parsing the whole input every time.
+        self.incremental = not (lazy or workers > 1 or cache is not None)
         self.file_contents = None
         self.parse_results = None
 
 
     def parse_contents(self , file_contents):
-        '''Parses input file using Moccasin's parser.'''
+        '''Parses input file using Moccasin's parser.  Unless the controller
+        was created with the options lazy, workers or cache (which reparsing
+        ignores), the parser keeps the pieces of the input it parsed, so that
+        afterwards only the parts of the input that changed are parsed again.'''
         self.file_contents = file_contents
-        self.parse_results = self.parser.parse_string(self.file_contents)
+        if self.incremental:
+            self.parse_results = self.parser.reparse(self.parse_results,
+                                                     self.file_contents)
+        else:
+            self.parse_results = self.parser.parse_string(self.file_contents)
 
 
     def check_translatable(self, relaxed = False):
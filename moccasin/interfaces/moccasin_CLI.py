@@ -38,12 +38,13 @@ except:
 
 import moccasin
 from moccasin.interfaces import moccasin_GUI
+from moccasin.matlab_parser import FastPath, GrammarProfile, ParseBudget, \
+    ParseCache, StatementMemo
+from moccasin.matlab_parser.parser import MatlabParsingBudgetException
+from moccasin.matlab_parser.grammar_utils import packrat_policy
 from .controller import Controller
 from .network_utils import have_network
 
-# This prevents exceeding recursion depth in some cases.
-sys.setrecursionlimit(5000)
-
 
 # -----------------------------------------------------------------------------
 # Main body.
@@ -61,11 +62,25 @@ sys.setrecursionlimit(5000)
     debug_parser  = ('print debug information about the parsed MATLAB',        'flag', 'D'),
     version       = ('print MOCCASIN version info and exit',                   'flag', 'V'),
     no_comments   = ('do not insert version comments into SBML output',        'flag', 'X'),
+    cache_dir     = ('cache parse results in directory DIR',                  'option', 'c', str, None, 'DIR'),
+    packrat       = ('parser memoization: "off", "unbounded", or max entries', 'option', 'm', str, None, 'POLICY'),
+    workers       = ('parse the functions in a file using N processes',        'option', 'j', int, None, 'N'),
+    lazy          = ('only parse the functions needed for the conversion',     'flag', 'L'),
+    statements    = ('reuse up to N parsed statements across input files',     'option', 's', int, None, 'N'),
+    fast_path     = ('recognize simple assignments without the full grammar',  'flag', 'F'),
+    profile       = ('write a profile of the grammar rules to FILE',          'option', 'P', str, None, 'FILE'),
+    time_limit    = ('give up parsing a file after SECONDS',                   'option', 't', float, None, 'SECONDS'),
+    step_limit    = ('give up parsing a file after N grammar steps',           'option', 'S', int, None, 'N'),
+    recover       = ('report all parse errors in a file instead of the first', 'flag', 'R'),
+    flatten       = ('represent long sums and products as single nodes',       'flag', 'n'),
     paths         = 'paths to MATLAB input files to convert'
 )
 
 def cli_main(gui, use_equations, use_params, quiet, relaxed, xpp_output,
-             no_color, debug_parser, version, no_comments, *paths):
+             no_color, debug_parser, version, no_comments, cache_dir=None,
+             packrat='unbounded', workers=1, lazy=False, statements=None,
+             fast_path=False, profile=None, time_limit=None, step_limit=None,
+             recover=False, flatten=False, *paths):
     '''Interface for controlling MOCCASIN, the MATLAB ODE converter for SBML.
 MOCCASIN can take certain forms of ODE (ordinary differential equation) models
 written in MATLAB and Octave and export them as SBML files.  MOCCASIN does not
@@ -134,6 +149,59 @@ the translation process:
   -x  (/x on Windows) makes the translator create XPP ODE files instead of
       SBML output
 
+  -c DIR  (/c DIR on Windows) makes MOCCASIN keep the results of parsing
+      MATLAB files in the directory DIR, so that converting the same file
+      again later can skip the parsing step
+
+  -m POLICY  (/m POLICY on Windows) sets the amount of memory the parser may
+      use for memoizing intermediate results: "off", "unbounded" (the
+      default), or a maximum number of entries.  Parsing is slower with
+      less memoization, but memory use is bounded
+
+  -j N  (/j N on Windows) makes the parser split a file with several
+      function definitions at the functions and parse the pieces using N
+      processes.  The file is parsed serially instead if it has fewer than
+      two top-level pieces, if the parser cannot tell whether its functions
+      are closed with "end", or if the results cannot be pickled to send
+      them back from the processes.  This option is ignored if any of -L,
+      -P, -t or -S is also given
+
+  -L  (/L on Windows) makes the parser skip the bodies of functions in the
+      file until they turn out to be needed; functions that cannot be reached
+      from the call to the odeNN solver are never parsed
+
+  -s N  (/s N on Windows) makes the parser remember the parsed form of up to
+      N statements, so that statements that appear in several of the input
+      files (e.g., copied parameter settings) are only parsed once
+
+  -F  (/F on Windows) makes the parser handle the simplest statements, such
+      as assignments of numbers and arithmetic formulas, with a quicker
+      method than the full MATLAB grammar, and report how many it handled
+
+  -P FILE  (/P FILE on Windows) counts how often each rule of the MATLAB
+      grammar is tried, succeeds, fails, or is answered from the memoized
+      results, and how much time is spent in it, and writes a table of the
+      counts for all input files to FILE, ordered by time.  If the name of
+      FILE ends in ".json", the table is written in JSON format
+
+  -t SECONDS  (/t SECONDS on Windows) makes MOCCASIN give up on an input
+      file if parsing it takes longer than SECONDS, report the place in the
+      file that the parser had reached, and go on to the next file
+
+  -S N  (/S N on Windows) is like -t but limits the number of steps taken
+      by the parser (i.e., attempts to match a rule of the MATLAB grammar)
+      instead of the time, which makes the limit reproducible
+
+  -R  (/R on Windows) makes the parser skip over the statements in a file
+      that it cannot parse and carry on with the rest, and then report all
+      of those statements instead of only the first; files with such
+      statements are not converted
+
+  -n  (/n on Windows) makes the parser represent a chain of terms joined by
+      the same operator +, *, && or || (e.g., a long sum in a rate law) as
+      a single expression with a list of terms, instead of nesting one
+      operation per term, which saves memory and time on large formulas
+
   -V  (/V on Windows) omits the comments that are inserted into the SBML file
       by default to record the MOCCASIN version used to create the file
 
@@ -153,7 +221,11 @@ SBML INteroperability".
     add_comments = not no_comments
 
     if gui or not any([paths, use_equations, use_params, xpp_output,
-                       version, debug_parser, quiet, no_comments]):
+                       version, debug_parser, quiet, no_comments, cache_dir,
+                       packrat != 'unbounded', workers != 1, lazy,
+                       statements is not None, fast_path, profile,
+                       time_limit is not None, step_limit is not None,
+                       recover, flatten]):
         moccasin_GUI.gui_main()
         sys.exit()
     if version:
@@ -171,11 +243,26 @@ SBML INteroperability".
     if not quiet:
         from halo import Halo
     extension = '.ode' if xpp_output else '.xml'
+    cache = ParseCache(cache_dir) if cache_dir else None
+    memo = StatementMemo(statements) if statements else None
+    fast_path = FastPath() if fast_path else None
+    profile_path = profile
+    profile = GrammarProfile() if profile_path else None
+    budget = None
+    if time_limit is not None or step_limit is not None:
+        budget = ParseBudget(seconds=time_limit, steps=step_limit)
+    try:
+        packrat = packrat_policy(packrat)
+    except ValueError as err:
+        raise SystemExit(color(str(err), 'error', colorize))
 
     # Define helper function used below.
 
     def convert(path):
-        controller = Controller()
+        controller = Controller(cache=cache, packrat=packrat, workers=workers,
+                                lazy=lazy, memo=memo, fast_path=fast_path,
+                                profile=profile, budget=budget,
+                                recover=recover, flatten=flatten)
         contents = file_contents(path, colorize)
         if debug_parser:
             print_header('{}'.format(path), 'info', quiet, colorize)
@@ -183,10 +270,22 @@ SBML INteroperability".
         if not debug_parser and not quiet:
             msg('Parsing MATLAB file "{}" ...'.format(path), 'info', colorize)
         controller.parse_contents(contents)
+        errors = controller.parse_results.errors
+        if errors:
+            for error in errors:
+                msg('Cannot parse lines {}-{} of "{}": {}'.format(
+                    error.first_line, error.last_line, path, error.message),
+                    'error', colorize)
+            msg('Skipping conversion of "{}".'.format(path), 'error', colorize)
+            return
         controller.check_translatable(relaxed)
         if debug_parser:
             print_header('Parsed MATLAB output', 'info', quiet, colorize)
             msg(controller.print_parsed_results())
+            if controller.parser.packrat_stats:
+                msg('Packrat: {0.entries} entries, {0.hits} hits, {0.misses}'
+                    ' misses, peak {0.peak}'.format(controller.parser.packrat_stats),
+                    'info', colorize)
         elif not quiet:
             msg('... finished.', 'info', colorize)
             msg('Converting to {} ...'.format('XPP' if xpp_output else 'SBML'),
@@ -263,10 +362,35 @@ SBML INteroperability".
         except IOError as err:
             msg('Error reading file "{}": {}'.format(path, err), 'error', colorize)
             continue
+        except MatlabParsingBudgetException as err:
+            msg('Gave up on file "{}": {}'.format(path, err), 'error', colorize)
+            continue
         except Exception as err:
             msg("Error: {0}".format(err), 'error', colorize)
             sys.exit()
 
+    if cache is not None and not quiet:
+        msg('Parse cache: {} hits, {} misses'.format(cache.hits, cache.misses),
+            'info', colorize)
+    if memo is not None and not quiet:
+        msg('Statement memo: {} hits, {} misses'.format(memo.hits, memo.misses),
+            'info', colorize)
+    if fast_path is not None and not quiet:
+        total = fast_path.hits + fast_path.misses
+        rate = 100.0 * fast_path.hits / total if total else 0.0
+        msg('Fast path: {} of {} statements ({:.1f}%)'.format(fast_path.hits,
+                                                              total, rate),
+            'info', colorize)
+    if profile is not None:
+        with open(profile_path, 'w') as profile_file:
+            if profile_path.endswith('.json'):
+                profile_file.write(profile.to_json())
+            else:
+                profile_file.write(profile.report() + '\n')
+        if not quiet:
+            msg('Wrote grammar profile to "{}"'.format(profile_path),
+                'info', colorize)
+
 # If this is windows, we want the command-line args to use slash intead
 # of hyphen.
 
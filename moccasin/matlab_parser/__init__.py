@@ -20,7 +20,9 @@
 # available online at https://github.com/sbmlteam/moccasin/.
 # ------------------------------------------------------------------------- -->
 
-from .parser import MatlabParser
+from .parser import MatlabParser, FastPath
+from .cache import ParseCache, StatementMemo
+from .grammar_utils import GrammarProfile, GrammarTrace, ParseBudget
 from .context import MatlabContext
 from .matlab import *
 from .functions import *
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+#
+# @file    cache.py
+# @brief   Caches of MATLAB parse results
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2018 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# Parsing a large MATLAB file with our PyParsing grammar is slow, and users
+# (as well as our own test and batch scripts) often parse the same files over
+# and over.  The ParseCache class below stores the MatlabContext produced by
+# a parse on disk, keyed by a hash of the exact input text combined with a
+# fingerprint of the parser itself.  A later parse of byte-identical input by
+# the same version of the parser can then simply load the stored result.
+#
+# The parser fingerprint is computed from the source code of the modules in
+# this package plus the version of PyParsing in use.  This means that any
+# change to the grammar or to the node classes automatically invalidates
+# everything previously stored, without anyone having to remember to bump a
+# version number.
+#
+# Entries are evicted in least-recently-used order when the cache exceeds its
+# configured maximum number of entries or maximum total size.  Recency is
+# tracked using file modification times, which are updated on every hit.
+#
+# The StatementMemo class is for inputs that are new but similar to others:
+# it keeps, in memory, the nodes PyParsing produced for single top-level
+# statements and statements of function bodies, keyed by their text.  A
+# parser given a StatementMemo parses its input a statement at a time and
+# only calls PyParsing for the statements not found in the memo.  One memo
+# can be shared by the parsers of all the files in a batch.
+
+from __future__ import print_function
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import pyparsing
+
+
+# Helper functions.
+# .............................................................................
+
+_fingerprint = []
+
+def parser_fingerprint():
+    """Returns a string identifying the current version of the parser.
+    The value changes whenever the source code of this package changes or
+    a different version of PyParsing is used."""
+    if not _fingerprint:
+        digest = hashlib.sha256()
+        digest.update(pyparsing.__version__.encode('utf-8'))
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(here)):
+            if name.endswith('.py'):
+                with open(os.path.join(here, name), 'rb') as f:
+                    digest.update(name.encode('utf-8'))
+                    digest.update(f.read())
+        _fingerprint.append(digest.hexdigest())
+    return _fingerprint[0]
+
+
+def default_cache_dir():
+    """Returns the default location of the parse cache directory."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join('~', '.cache')
+    return os.path.join(os.path.expanduser(base), 'moccasin', 'parse')
+
+
+# Main class.
+# .............................................................................
+
+class ParseCache(object):
+    """Persistent cache of MatlabContext objects stored in `directory`.
+
+    The cache holds at most `max_entries` results and at most `max_bytes`
+    bytes of data on disk (either limit may be None to disable it).  The
+    attributes `hits` and `misses` count the lookups made through this
+    object.
+    """
+
+    _suffix = '.pickle'
+
+    def __init__(self, directory=None, max_entries=1000,
+                 max_bytes=256*1024*1024):
+        self.directory = os.path.abspath(directory or default_cache_dir())
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+
+    def __repr__(self):
+        return 'ParseCache({!r}, hits={}, misses={})'.format(
+            self.directory, self.hits, self.misses)
+
+
+    def key(self, text, *options):
+        """Returns the cache key for MATLAB input `text`.  Additional values
+        in `options` that influence the parse result are folded into the key.
+        """
+        digest = hashlib.sha256()
+        digest.update(parser_fingerprint().encode('utf-8'))
+        for opt in options:
+            digest.update(repr(opt).encode('utf-8'))
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8', 'surrogateescape')
+        digest.update(text)
+        return digest.hexdigest()
+
+
+    def get(self, key):
+        """Returns the MatlabContext stored under `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                context = pickle.load(f)
+        except Exception:
+            # Missing, truncated or otherwise unreadable entries are misses.
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return context
+
+
+    def put(self, key, context):
+        """Stores the MatlabContext `context` under `key`."""
+        try:
+            data = pickle.dumps(context, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, RecursionError, TypeError):
+            # Some results cannot be stored (e.g., very deeply nested
+            # expressions).  That's not an error; they just won't be cached.
+            return
+        # Write to a temporary file first and then rename it, so that a
+        # concurrent reader never sees a partially written entry.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._evict()
+
+
+    def clear(self):
+        """Removes every entry from the cache and resets the counters."""
+        for path, _, _ in self._entries():
+            self._remove(path)
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self._entries())
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self._suffix)
+
+
+    def _entries(self):
+        """Returns a list of (path, mtime, size) tuples, oldest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self._suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        entries.sort(key=lambda entry: entry[1])
+        return entries
+
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        while entries and ((self.max_entries is not None
+                            and len(entries) > self.max_entries)
+                           or (self.max_bytes is not None
+                               and total > self.max_bytes)):
+            path, _, size = entries.pop(0)
+            self._remove(path)
+            total -= size
+
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class StatementMemo(object):
+    """In-memory memo of the nodes parsed from single statements.
+
+    The memo holds at most `max_entries` entries (None means no limit) and
+    evicts them in least-recently-used order.  The values must be treated
+    as read-only by the parser, which copies them before using them.  The
+    attributes `hits` and `misses` count the lookups made through this
+    object.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+
+    def __repr__(self):
+        return 'StatementMemo({}, hits={}, misses={})'.format(
+            self.max_entries, self.hits, self.misses)
+
+
+    def get(self, key):
+        """Returns the list of nodes stored under `key`, or None."""
+        nodes = self._entries.get(key)
+        if nodes is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return nodes
+
+
+    def put(self, key, nodes):
+        """Stores the list of nodes `nodes` under `key`."""
+        self._entries[key] = nodes
+        self._entries.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        """Removes every entry from the memo and resets the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self._entries)
@@ -56,6 +56,54 @@ class ContextDict(collections.MutableMapping, dict):
         return dict.__contains__(self, x)
 
 
+# FunctionDict is the ContextDict used for MatlabContext.functions.  It can
+# also hold functions whose bodies have not been parsed yet (see the `lazy`
+# option of MatlabParser).  The value of such an entry is a MatlabContext
+# with just the name, parameters and return values; the rest is filled in by
+# calling the entry's loader the first time the value is looked up, which
+# includes get(), items() and values().  Testing for a key or iterating over
+# the keys does not load anything.
+
+class FunctionDict(ContextDict):
+    """Class used to implement the 'functions' property of MatlabContext."""
+
+    def __init__(self):
+        ContextDict.__init__(self)
+        self._loaders = {}
+
+    def __getitem__(self, key):
+        if key in self._loaders:
+            self._loaders.pop(key)()
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self._loaders.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._loaders.pop(key, None)
+        dict.__delitem__(self, key)
+
+    def __reduce__(self):
+        # Pickles and copies must be complete, so load everything first.
+        return (FunctionDict, (), None, None, iter(self.items()))
+
+    def defer(self, key, value, loader):
+        """Stores `value` under `key`, to be completed by calling `loader`
+        when it is first looked up."""
+        dict.__setitem__(self, key, value)
+        self._loaders[key] = loader
+
+    def pending(self):
+        """Returns the keys of the entries that have not been loaded."""
+        return list(self._loaders)
+
+    def loaded_items(self):
+        """Returns the (key, value) pairs of the loaded entries only."""
+        return [(key, dict.__getitem__(self, key)) for key in self
+                if key not in self._loaders]
+
+
 class MatlabContext(object):
     """Class for tracking our interpretation of MATLAB parsing results.  Most
     properties of objects of this class are used to store things that are
@@ -121,6 +169,16 @@ class MatlabContext(object):
       file:        If the contents of this context came from a file, the path
                    to the file.
 
+      chunks:      For a topmost context returned by MatlabParser.reparse(),
+                   the parsed form of each top-level statement or function
+                   definition of the input, kept for the next call to
+                   reparse().  Otherwise None.
+
+      errors:      For a topmost context returned by a MatlabParser in error
+                   recovery mode, the Unparsed nodes standing in for the
+                   parts of the input that could not be parsed, in the order
+                   of the input.  Otherwise an empty list.
+
     Users can access via the normal x.propname approach.
 
     To make a copy of a Context object, use the Python 'copy' module.
@@ -138,7 +196,9 @@ class MatlabContext(object):
         self.nodes          = nodes      # The list of MatlabNode objects.
         self.parse_results  = pr         # The corresponding ParseResults obj.
         self.file           = file       # The path to the file, if any.
-        self._functions     = ContextDict()
+        self.chunks         = None       # Pieces kept for reparse().
+        self.errors         = []         # Unparsed nodes, if recovering.
+        self._functions     = FunctionDict()
         self._assignments   = ContextDict()
         self._calls         = ContextDict()
         self._types         = ContextDict()
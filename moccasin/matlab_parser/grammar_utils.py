@@ -20,11 +20,19 @@
 # available online at https://github.com/sbmlteam/moccasin/.
 # ------------------------------------------------------------------------- -->
 
+import bisect
 import functools
 import inspect
+import json
+import re
 import sys
 import six
-from pyparsing import ParseResults
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
+from pyparsing import Forward, Optional, Or, ParseElementEnhance, \
+    ParseException, ParseExpression, ParseResults, ParserElement, Suppress, \
+    col, lineno, opAssoc
 
 #
 # Parsing helpers.
@@ -56,6 +64,35 @@ def makeLRlike(numterms):
     return pa
 
 
+# leave_whitespace -- used in the definition of our grammar in grammar.py
+#
+# Does the same as expr.leaveWhitespace() in PyParsing 2.x: makes whitespace
+# significant for `expr` and copies of everything it contains, down to (and
+# including) the Forward elements, which stop the copying.  PyParsing does
+# this by copying each subexpression in full and then doing the same again
+# for its subexpressions, so the work grows with the square of the depth;
+# on the array elements of our grammar, that made up most of the time taken
+# to import the parser.  Here each element is copied once.
+
+def leave_whitespace(expr):
+    """Like expr.leaveWhitespace(), but copying each subexpression once."""
+    expr.skipWhitespace = False
+    if isinstance(expr, ParseExpression):
+        expr.exprs = [leave_whitespace(_copy_element(e)) for e in expr.exprs]
+    elif (isinstance(expr, ParseElementEnhance) and not isinstance(expr, Forward)
+          and expr.expr is not None):
+        expr.expr = leave_whitespace(_copy_element(expr.expr))
+    return expr
+
+
+def _copy_element(expr):
+    # ParseExpression.copy() would copy the subexpressions too, but
+    # leave_whitespace() replaces them with copies of its own anyway.
+    if isinstance(expr, ParseExpression):
+        return ParserElement.copy(expr)
+    return expr.copy()
+
+
 # From http://pyparsing.wikispaces.com/share/view/41237655
 
 def setVar(varname, varvalue):
@@ -64,6 +101,1001 @@ def setVar(varname, varvalue):
     return parseAction
 
 
+# PredictiveOr -- used for statement-level alternatives in grammar.py
+#
+# PyParsing's Or ("^") tries every alternative in full at every position and
+# keeps the longest match.  At the level of statements, most alternatives
+# can be ruled out simply by looking at the next non-whitespace character:
+# a comment starts with '%', a shell command with '!', and so on.  The class
+# below is given the characters that each alternative can start with, tries
+# only the alternatives that are possible at the current position, and
+# otherwise behaves exactly like Or.  The pseudo-character '\n' in a start
+# set stands for "a line end or the end of the input"; it is needed for
+# alternatives that can match an end of line explicitly.
+
+_WHITESPACE = ' \t\r\n'
+
+class PredictiveOr(Or):
+    """Longest-match alternation that dispatches on the next character."""
+
+    def __init__(self, alternatives):
+        super(PredictiveOr, self).__init__([expr for expr, _ in alternatives])
+        # Store indexes rather than the expressions themselves, so that
+        # copies of this object (which copy self.exprs) stay consistent.
+        self._starts = [starts for _, starts in alternatives]
+        self._candidates = {}
+
+    def _candidate_indexes(self, char, at_eol):
+        key = (char, at_eol)
+        if key not in self._candidates:
+            self._candidates[key] = [i for i, starts in enumerate(self._starts)
+                                     if char in starts
+                                     or (at_eol and '\n' in starts)]
+        return self._candidates[key]
+
+    def parseImpl(self, instring, loc, doActions=True):
+        end = len(instring)
+        pos = loc
+        at_eol = False
+        while pos < end and instring[pos] in _WHITESPACE:
+            if instring[pos] == '\n':
+                at_eol = True
+            pos += 1
+        # At the end of the input, only an end-of-line match is possible.
+        char = instring[pos] if pos < end else '\n'
+        indexes = self._candidate_indexes(char, at_eol)
+        if len(indexes) == 1:
+            # The common case: no need to try first and then parse again.
+            try:
+                return self.exprs[indexes[0]]._parse(instring, loc, doActions)
+            except ParseException as err:
+                err.msg = self.errmsg
+                raise
+        maxExcLoc = -1
+        maxException = None
+        matches = []
+        for i in indexes:
+            expr = self.exprs[i]
+            try:
+                loc2 = expr.tryParse(instring, loc)
+            except ParseException as err:
+                if err.loc > maxExcLoc:
+                    maxException = err
+                    maxExcLoc = err.loc
+            except IndexError:
+                if len(instring) > maxExcLoc:
+                    maxException = ParseException(instring, len(instring),
+                                                  expr.errmsg, self)
+                    maxExcLoc = len(instring)
+            else:
+                matches.append((loc2, expr))
+        matches.sort(key=lambda x: -x[0])
+        for _, expr in matches:
+            try:
+                return expr._parse(instring, loc, doActions)
+            except ParseException as err:
+                if err.loc > maxExcLoc:
+                    maxException = err
+                    maxExcLoc = err.loc
+        if maxException is None:
+            maxException = ParseException(instring, loc, self.errmsg, self)
+        maxException.msg = self.errmsg
+        raise maxException
+
+
+# InfixExpression -- used for the expression grammar in grammar.py
+#
+# PyParsing's infixNotation() builds one Forward per precedence level, each
+# made of a FollowedBy lookahead, a Group and a MatchFirst.  Every operand
+# is reached by descending through all of the levels, and every level that
+# matches parses its operands twice.  For long formulas this is where most
+# of the parsing time goes.  The class below accepts the same operator list
+# as infixNotation() and produces the same ParseResults, but works by
+# precedence climbing: prefix operators are tried first, then the operand
+# itself, and then only the operators of the levels above the ones already
+# matched.  Intermediate results are memoized per call, so no level is
+# parsed twice at the same position.  Whitespace is handled the way the
+# elements generated by infixNotation() handle it.  Parse actions given in
+# the operator list must accept the arguments (s, loc, toks).
+
+class InfixExpression(ParserElement):
+    """Precedence-climbing replacement for PyParsing's infixNotation()."""
+
+    def __init__(self, baseExpr, opList, lpar=Suppress('('), rpar=Suppress(')')):
+        super(InfixExpression, self).__init__()
+        self.baseExpr = baseExpr
+        self.lpar = lpar
+        self.rpar = rpar
+        self.levels = []
+        for opDef in opList:
+            opExpr, arity, assoc, action = (tuple(opDef) + (None,))[:4]
+            if arity not in (1, 2, 3):
+                raise ValueError('operator must be unary (1), binary (2), or ternary (3)')
+            if assoc not in (opAssoc.LEFT, opAssoc.RIGHT):
+                raise ValueError('operator must indicate right or left associativity')
+            if arity == 3 and (not isinstance(opExpr, (tuple, list)) or len(opExpr) != 2):
+                raise ValueError('if numterms=3, opExpr must be a tuple or list of two expressions')
+            if arity == 1 and assoc == opAssoc.RIGHT and isinstance(opExpr, Optional):
+                opExpr = opExpr.expr
+            if action is None:
+                action = []
+            elif not isinstance(action, (tuple, list)):
+                action = [action]
+            self.levels.append((opExpr, arity, assoc == opAssoc.RIGHT, action))
+        # Prefix operators, from the loosest binding to the tightest.
+        self._prefixes = [i for i in reversed(range(len(self.levels)))
+                          if self.levels[i][1] == 1 and self.levels[i][2]]
+        self.setName('expression')
+
+
+    def _generateDefaultName(self):
+        # Required (and used instead of __str__) by PyParsing 3.
+        return 'expression'
+
+
+    def __str__(self):
+        return self.name
+
+
+    def streamline(self):
+        if not self.streamlined:
+            super(InfixExpression, self).streamline()
+            for expr in self._subexpressions():
+                expr.streamline()
+        return self
+
+
+    def _subexpressions(self):
+        exprs = [self.baseExpr, self.lpar, self.rpar]
+        for opExpr, arity, _, _ in self.levels:
+            exprs.extend(opExpr if arity == 3 else [opExpr])
+        return exprs
+
+
+    def parseImpl(self, instring, loc, doActions=True):
+        return self._climb(instring, loc, doActions, len(self.levels) - 1, {})
+
+
+    def _climb(self, instring, loc, doActions, top, memo):
+        # Parse an expression made of operators at level 'top' and below.
+        key = (loc, top, doActions)
+        if key not in memo:
+            try:
+                memo[key] = self._climbImpl(instring, loc, doActions, top, memo)
+            except (ParseException, IndexError) as err:
+                memo[key] = err
+        result = memo[key]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+    def _climbImpl(self, instring, loc, doActions, top, memo):
+        # The per-level Forwards of infixNotation() all skip whitespace
+        # (including line ends) before an operand, and so do we.
+        end = len(instring)
+        while loc < end and instring[loc] in self.whiteChars:
+            loc += 1
+        start = loc
+        current = -1
+        for level in self._prefixes:
+            if level > top:
+                continue
+            opExpr, _, _, action = self.levels[level]
+            try:
+                oploc, optoks = self._parseWrapped(opExpr, instring, loc, doActions)
+                loc, operand = self._climb(instring, oploc, doActions, level, memo)
+            except (ParseException, IndexError):
+                continue
+            toks = self._group(instring, start, [optoks, operand], action)
+            current = level
+            break
+        else:
+            loc, toks = self._primary(instring, loc, doActions, memo)
+
+        for level in range(current + 1, top + 1):
+            opExpr, arity, right, action = self.levels[level]
+            if arity == 1 and right:
+                continue
+            operandLevel = level if right else level - 1
+            if arity == 1:
+                pieces = self._postfix(instring, loc, doActions, opExpr)
+            elif arity == 2:
+                pieces = self._binary(instring, loc, doActions, opExpr,
+                                      operandLevel, memo)
+            else:
+                pieces = self._ternary(instring, loc, doActions, opExpr,
+                                       operandLevel, memo)
+            if pieces:
+                loc = pieces[0]
+                toks = self._group(instring, start, [toks] + pieces[1:], action)
+        return loc, toks
+
+
+    def _primary(self, instring, loc, doActions, memo):
+        try:
+            return self.baseExpr._parse(instring, loc, doActions)
+        except (ParseException, IndexError):
+            pass
+        try:
+            loc, _ = self.lpar._parse(instring, loc, doActions)
+            loc, toks = self._climb(instring, loc, doActions,
+                                    len(self.levels) - 1, memo)
+            loc, _ = self.rpar._parse(instring, loc, doActions)
+        except (ParseException, IndexError):
+            raise ParseException(instring, loc, self.errmsg, self)
+        return loc, toks
+
+
+    def _postfix(self, instring, loc, doActions, opExpr):
+        pieces = [loc]
+        while True:
+            try:
+                loc, optoks = opExpr._parse(instring, loc, doActions)
+            except (ParseException, IndexError):
+                break
+            pieces[0] = loc
+            pieces.append(optoks)
+        return pieces if len(pieces) > 1 else None
+
+
+    def _binary(self, instring, loc, doActions, opExpr, operandLevel, memo):
+        if not opExpr.callPreparse:
+            # infixNotation()'s lookahead tries the first operator without
+            # skipping whitespace, which makes a difference for operators
+            # that handle whitespace themselves.
+            try:
+                oploc, _ = opExpr._parse(instring, loc, False)
+                self._climb(instring, oploc, False, operandLevel, memo)
+            except (ParseException, IndexError):
+                return None
+        pieces = [loc]
+        while True:
+            try:
+                oploc, optoks = self._parseWrapped(opExpr, instring, loc, doActions)
+                loc, operand = self._climb(instring, oploc, doActions,
+                                           operandLevel, memo)
+            except (ParseException, IndexError):
+                break
+            pieces[0] = loc
+            pieces.extend([optoks, operand])
+        return pieces if len(pieces) > 1 else None
+
+
+    def _ternary(self, instring, loc, doActions, opExprs, operandLevel, memo):
+        try:
+            loc, optoks1 = opExprs[0]._parse(instring, loc, doActions)
+            loc, middle = self._climb(instring, loc, doActions, operandLevel, memo)
+            loc, optoks2 = opExprs[1]._parse(instring, loc, doActions)
+            loc, last = self._climb(instring, loc, doActions, operandLevel, memo)
+        except (ParseException, IndexError):
+            return None
+        return [loc, optoks1, middle, optoks2, last]
+
+
+    def _parseWrapped(self, opExpr, instring, loc, doActions):
+        # Parse an operator the way it is parsed when it starts an And: the
+        # And skips the operator's whitespace even if the operator itself
+        # would not.
+        loc = opExpr.preParse(instring, loc)
+        return opExpr._parse(instring, loc, doActions, callPreParse=False)
+
+
+    def _group(self, instring, loc, pieces, action):
+        flat = ParseResults([])
+        for toks in pieces:
+            flat += toks
+        toks = ParseResults([flat])
+        for fn in action:
+            result = fn(instring, loc, toks)
+            if result is not None:
+                toks = ParseResults(result)
+        return toks
+
+
+# function_style -- used to pick the variant of the grammar in grammar.py
+#
+# In a MATLAB file, either every function definition is terminated with
+# 'end' or none is.  The following function determines which style a file
+# uses without parsing it, by counting block keywords and 'end' keywords.
+# Only keywords at the start of a statement are counted; this leaves out
+# those in comments, strings, shell commands, subscripts ("a(end)"), field
+# names ("s.end") and arguments of command-syntax calls ("hold end").  If
+# the number of 'end's equals the number of blocks, functions have 'end's;
+# if it equals the number of blocks other than functions, they don't.  The
+# return value is 'deep' or 'shallow' (after the names of the grammar
+# objects for the two kinds of function definitions), 'mixed' if the counts
+# fall in between, 'unknown' if the counts make no sense (which would mean
+# the scan was fooled by something), or None if there are no functions.
+
+_BLOCK_KEYWORDS = frozenset(['classdef', 'for', 'function', 'if', 'parfor',
+                             'spmd', 'switch', 'try', 'while'])
+
+# Keywords that can be followed directly by another statement.
+_OTHER_KEYWORDS = frozenset(['case', 'catch', 'else', 'elseif', 'otherwise'])
+
+# A quote right after one of these characters is a transpose operator.
+_TRANSPOSE_AFTER = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                             "0123456789_)]}.'")
+
+_SCAN_TOKEN  = re.compile(r"""(?P<comment>%\{.*?%\}|%[^\n]*)
+                            | (?P<shell>^[ \t]*![^\n]*)
+                            | (?P<dqstring>"(?:[^"\n]|"")*")
+                            | (?P<quote>')
+                            | (?P<word>[A-Za-z]\w*)
+                            | (?P<open>[(\[{])
+                            | (?P<close>[)\]}])
+                            | (?P<sep>[,;\n])
+                            | (?P<other>[^\s,;%'"A-Za-z()\[\]{}]+|\S)""",
+                          re.M | re.S | re.X)
+_SCAN_STRING = re.compile(r"'(?:[^'\n]|'')*'")
+
+class StatementScanner(object):
+    """Follows MATLAB text fed to it one line at a time, keeping the counts
+    function_style() needs and enough state to tell whether the lines so
+    far end at the boundary of a top-level statement.  If `functions_end`
+    is True, function definitions are taken to be closed by 'end'."""
+
+    def __init__(self, functions_end=False):
+        self.blocks = self.ends = self.functions = 0
+        self.open_blocks = 0
+        self.depth = 0
+        self.at_start = True
+        self.in_comment = False
+        self.continued = False
+        self.functions_end = functions_end
+
+    def complete(self):
+        """Returns True if the lines so far form whole statements."""
+        return not (self.open_blocks or self.depth or self.in_comment
+                    or self.continued)
+
+    def feed(self, line):
+        pos = 0
+        if self.in_comment:
+            pos = line.find('%}')
+            if pos < 0:
+                return
+            self.in_comment = False
+            pos += 2
+        self.continued = False
+        while True:
+            match = _SCAN_TOKEN.search(line, pos)
+            if not match:
+                break
+            kind = match.lastgroup
+            start = match.start()
+            pos = match.end()
+            if kind == 'comment':
+                text = match.group()
+                if text.startswith('%{') and not text.endswith('%}'):
+                    # A block comment that ends on a later line.
+                    self.in_comment = True
+                    break
+                continue
+            elif kind == 'shell' or kind == 'dqstring':
+                continue
+            elif kind == 'other' and '...' in match.group():
+                # The rest of the line is a continuation.
+                self.continued = True
+                break
+            elif kind == 'open':
+                self.depth += 1
+            elif kind == 'close':
+                self.depth = max(self.depth - 1, 0)
+            elif kind == 'quote':
+                if start and line[start - 1] in _TRANSPOSE_AFTER:
+                    pass
+                else:
+                    string = _SCAN_STRING.match(line, start)
+                    if string:
+                        pos = string.end()
+            elif self.depth:
+                continue
+            elif kind == 'sep':
+                self.at_start = True
+                continue
+            elif kind == 'word' and self.at_start:
+                word = match.group()
+                if word == 'end' or word in _OTHER_KEYWORDS:
+                    if word == 'end':
+                        self.ends += 1
+                        self.open_blocks = max(self.open_blocks - 1, 0)
+                    continue
+                elif word in _BLOCK_KEYWORDS:
+                    self.blocks += 1
+                    if word != 'function':
+                        self.open_blocks += 1
+                    else:
+                        self.functions += 1
+                        self.open_blocks += self.functions_end
+                    continue
+            self.at_start = False
+
+    def style(self):
+        """Returns the function style of the lines so far, as explained
+        for function_style()."""
+        if not self.functions:
+            return None
+        elif self.ends == self.blocks:
+            return 'deep'
+        elif self.ends == self.blocks - self.functions:
+            return 'shallow'
+        elif self.blocks - self.functions < self.ends < self.blocks:
+            return 'mixed'
+        else:
+            return 'unknown'
+
+
+def _lines(text):
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start) + 1 or len(text)
+        yield text[start:end]
+        start = end
+
+
+def function_style(text):
+    scanner = StatementScanner()
+    for line in _lines(text):
+        scanner.feed(line)
+    return scanner.style()
+
+
+# top_level_chunks -- used by MatlabParser.iter_parse()
+#
+# Splits the lines of a file into chunks that the grammar can parse on their
+# own, given the function style of the whole file: single top-level
+# statements (including multi-line ones and whole control blocks) and
+# function definitions.  A function without 'end' runs until the next line
+# that starts with "function" outside other blocks, so its chunk also takes
+# in whatever follows it up to there.  If the style is 'unknown', everything
+# from the first function definition on is one chunk.  Yields pairs of the
+# chunk text and the number of its first line.
+
+_FUNCTION_LINE = re.compile(r'[ \t]*function\b')
+
+def top_level_chunks(lines, style):
+    scanner = StatementScanner(functions_end=(style in ['deep', 'mixed']))
+    split_functions = (style != 'unknown')
+    chunk = []
+    first = 1
+    for number, line in enumerate(lines, 1):
+        if (chunk and scanner.functions and not scanner.functions_end
+                and split_functions and scanner.complete()
+                and scanner.at_start and _FUNCTION_LINE.match(line)):
+            yield ''.join(chunk), first
+            chunk = []
+        if not chunk:
+            first = number
+        chunk.append(line)
+        scanner.feed(line)
+        if scanner.complete() and (scanner.functions_end
+                                   or not scanner.functions):
+            yield ''.join(chunk), first
+            chunk = []
+    if chunk:
+        yield ''.join(chunk), first
+
+
+# inline_function -- used by MatlabParser in lazy mode
+#
+# A chunk from top_level_chunks() can hold more than one top-level function
+# definition when one starts on the line where the previous one ends, as in
+# "end function g".  Returns True if some line of the text has the keyword
+# "function" after other (non-comment) text.  This errs on the side of
+# saying yes, e.g., for a string containing the word.
+
+_INLINE_FUNCTION = re.compile(r'^[ \t]*[^%\s][^%\n]*\bfunction\b', re.M)
+
+def inline_function(text):
+    return bool(_INLINE_FUNCTION.search(text))
+
+
+# statement_key -- used by MatlabParser to look up text in a StatementMemo
+#
+# Indentation makes no difference to how a statement parses, so it is left
+# out of the key, as are DOS line endings.  Text with a block comment is
+# kept as it is, because the comment's node holds its lines as written.  So
+# is text with a tab after the indentation of a line, because preprocess()
+# expands tabs to the next tab stop, which depends on the indentation.
+
+_INDENTATION = re.compile(r'^[ \t]+', re.M)
+_TAB_AFTER_INDENTATION = re.compile(r'^[ \t]+[^ \t\n][^\n]*\t', re.M)
+
+def statement_key(text):
+    text = text.replace('\r\n', '\n')
+    if '%{' in text or _TAB_AFTER_INDENTATION.search(text):
+        return text
+    return _INDENTATION.sub('', text)
+
+
+# preprocess -- used by MatlabParser on its input before parsing
+#
+# The grammar cannot deal with continuations ("..." followed by the rest of
+# the line), which MATLAB treats as a space, so they are replaced here.  At
+# the same time, DOS line endings become plain line feeds and tabs are
+# expanded the way PyParsing would otherwise expand them itself.  The text
+# is scanned once, and "..." is left alone inside strings, line comments,
+# block comments and shell commands, where it is not a continuation.  The
+# return value is the new text and an OffsetMap that translates positions
+# in it back to positions in the original text, for reporting errors.
+
+_PREPROCESS_TOKEN = re.compile(r"""(?P<crlf>\r\n)
+                                   | (?P<block>%\{.*?%\})
+                                   | (?P<comment>%[^\r\n]*)
+                                   | (?P<shell>![^\r\n]*)
+                                   | (?P<continuation>\.\.\.[^\r\n\f]*(?:\r?\n|\Z))
+                                   | (?P<dqstring>"(?:[^"\r\n]|"")*")
+                                   | (?P<quote>')""",
+                               re.S | re.X)
+
+class OffsetMap(object):
+    """Translates positions in preprocessed text to the original text."""
+
+    def __init__(self, edits, parent=None):
+        # 'edits' is a list of (new, old) pairs of positions after which the
+        # two texts are the same again, in increasing order.
+        self._new = [0] + [new for new, _ in edits]
+        self._old = [0] + [old for _, old in edits]
+        self._parent = parent
+
+    def original(self, pos):
+        i = bisect.bisect_right(self._new, pos) - 1
+        delta = pos - self._new[i]
+        if i + 1 < len(self._old):
+            # Don't run past a replacement longer than what it replaced.
+            delta = min(delta, self._old[i + 1] - self._old[i] - 1)
+        pos = self._old[i] + delta
+        return self._parent.original(pos) if self._parent else pos
+
+
+def _apply_edits(text, edits, parent=None):
+    # Each edit is a tuple (start, end, replacement), in increasing order.
+    pieces = []
+    breaks = []
+    last = 0
+    length = 0
+    for start, end, replacement in edits:
+        pieces.append(text[last:start])
+        pieces.append(replacement)
+        length += start - last + len(replacement)
+        breaks.append((length, end))
+        last = end
+    pieces.append(text[last:])
+    return ''.join(pieces), OffsetMap(breaks, parent)
+
+
+def _tab_edits(text):
+    edits = []
+    line_start = 0
+    extra = 0
+    for match in re.finditer('[\t\n\r]', text):
+        pos = match.start()
+        if text[pos] == '\t':
+            spaces = 8 - (pos - line_start + extra) % 8
+            edits.append((pos, pos + 1, ' ' * spaces))
+            extra += spaces - 1
+        else:
+            line_start = pos + 1
+            extra = 0
+    return edits
+
+
+def preprocess(text):
+    edits = []
+    pos = 0
+    while True:
+        match = _PREPROCESS_TOKEN.search(text, pos)
+        if not match:
+            break
+        kind = match.lastgroup
+        start = match.start()
+        pos = match.end()
+        if kind == 'crlf':
+            edits.append((start, pos, '\n'))
+        elif kind == 'continuation':
+            edits.append((start, pos, ' '))
+        elif kind == 'block':
+            crlf = text.find('\r\n', start, pos)
+            while crlf >= 0:
+                edits.append((crlf, crlf + 2, '\n'))
+                crlf = text.find('\r\n', crlf + 2, pos)
+        elif kind == 'quote':
+            if start == 0 or text[start - 1] not in _TRANSPOSE_AFTER:
+                string = _SCAN_STRING.match(text, start)
+                if string:
+                    pos = string.end()
+    text, offsets = _apply_edits(text, edits)
+    if '\t' in text:
+        text, offsets = _apply_edits(text, _tab_edits(text), offsets)
+    return text, offsets
+
+
+#
+# Packrat memoization.
+# .............................................................................
+# PyParsing's packrat cache is a single class-level table shared by every
+# grammar in the process.  Its built-in variants are either unbounded or a
+# FIFO of fixed size, and neither reports how big the table actually got.
+# The PackratCache class below is a drop-in replacement for them (PyParsing
+# only uses get(), set(), clear(), len() and the not_in_cache sentinel) that
+# evicts in least-recently-used order and records its peak size.
+#
+# A packrat policy is one of the following values:
+#   False or 0      -- memoization is disabled
+#   True or None    -- memoization with an unbounded table
+#   integer N > 0   -- memoization with an LRU table of at most N entries
+# The function packrat_policy() also accepts the strings 'off', 'unbounded'
+# and digits, which is convenient for command-line interfaces.
+
+PackratStats = namedtuple('PackratStats', 'policy entries hits misses peak')
+
+
+class PackratCache(object):
+    """Memo table for PyParsing packrat parsing, optionally LRU-bounded."""
+
+    def __init__(self, size=None):
+        self.size = size
+        self.not_in_cache = object()
+        self.peak = 0
+        self.on_hit = None
+        self._cache = OrderedDict()
+
+    def get(self, key):
+        value = self._cache.get(key, self.not_in_cache)
+        if value is not self.not_in_cache:
+            if self.size:
+                self._cache.move_to_end(key)
+            if self.on_hit is not None:
+                self.on_hit(key[0])
+        return value
+
+    def set(self, key, value):
+        cache = self._cache
+        cache[key] = value
+        if self.size:
+            cache.move_to_end(key)
+            while len(cache) > self.size:
+                cache.popitem(last=False)
+        if len(cache) > self.peak:
+            self.peak = len(cache)
+
+    def clear(self):
+        self._cache.clear()
+        self.peak = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def packrat_policy(value):
+    """Normalizes `value` to one of False, None (unbounded) or a positive
+    integer, raising ValueError if `value` is not a valid policy."""
+    if isinstance(value, six.string_types):
+        lowered = value.strip().lower()
+        if lowered in ['off', 'none', 'no', 'false', '0']:
+            return False
+        if lowered in ['unbounded', 'on', 'yes', 'true']:
+            return None
+        if lowered.isdigit():
+            return int(lowered)
+        raise ValueError('Unrecognized packrat policy "{}"'.format(value))
+    if value is None or value is True:
+        return None
+    if value is False or value == 0:
+        return False
+    if isinstance(value, int) and value > 0:
+        return value
+    raise ValueError('Unrecognized packrat policy {!r}'.format(value))
+
+
+def set_packrat_policy(policy):
+    """Configures PyParsing's packrat memoization according to `policy`
+    and starts with an empty table."""
+    policy = packrat_policy(policy)
+    if policy is False:
+        ParserElement.packrat_cache = PackratCache()
+        ParserElement._parse = ParserElement._parseNoCache
+    else:
+        ParserElement.packrat_cache = PackratCache(policy)
+        ParserElement._parse = ParserElement._parseCache
+    # Prevent later calls to enablePackrat() from replacing our table.
+    ParserElement._packratEnabled = True
+    ParserElement.resetCache()
+
+
+def packrat_stats(policy):
+    """Returns a PackratStats tuple describing the current packrat table."""
+    cache = ParserElement.packrat_cache
+    hits, misses = ParserElement.packrat_cache_stats[:2]
+    return PackratStats(policy=packrat_policy(policy), entries=len(cache),
+                        hits=hits, misses=misses,
+                        peak=getattr(cache, 'peak', len(cache)))
+
+
+#
+# Grammar profiling and tracing.
+# .............................................................................
+# Both of the classes below work by installing PyParsing debug actions on
+# the grammar elements, which are class attributes of MatlabParser shared by
+# every parser in the process.  The actions are only installed for the
+# duration of a `with recorder.recording(elements):` block, and the previous
+# debug settings of the elements are restored afterwards, so the cost of
+# profiling or tracing is not borne by later parses.  Actions that were
+# already in effect (e.g., those of a profile, when a trace is recorded at
+# the same time) keep being called.
+#
+# A GrammarProfile counts, for each of a set of grammar elements, how many
+# times PyParsing tried to match it, how many of the tries succeeded and
+# failed, how many lookups of it were answered by the packrat table instead
+# (these are not tries), and the total time spent in its tries.  The time of
+# an element includes the time of the elements inside it.  The counts
+# accumulate over any number of recordings.  Elements are reported under
+# their names, so they should be given names with setName() beforehand.
+#
+# A GrammarTrace records the same events as text lines like those printed by
+# PyParsing's own debugging output, but keeps them in a ring buffer of
+# limited size or writes them to a file instead of printing them, and can be
+# limited to elements with given names.
+
+@contextmanager
+def _debug_actions(elements, start, success, failure):
+    # Installs the three debug actions on the elements during the block.
+    unique = list(OrderedDict.fromkeys(elements))
+    saved = [(element, element.debug, element.debugActions) for element in unique]
+    for element, debug, actions in saved:
+        if debug:
+            element.setDebugActions(_chained(start, actions[0]),
+                                    _chained(success, actions[1]),
+                                    _chained(failure, actions[2]))
+        else:
+            element.setDebugActions(start, success, failure)
+    try:
+        yield
+    finally:
+        for element, debug, actions in saved:
+            element.debugActions = actions
+            element.debug = debug
+
+
+def _chained(action, previous):
+    if not previous:
+        return action
+    def both(*args):
+        action(*args)
+        previous(*args)
+    return both
+
+
+@contextmanager
+def no_recording():
+    """Context manager that does nothing; a stand-in for recording() and
+    BudgetMeter.running()."""
+    yield
+
+
+RuleStats = namedtuple('RuleStats', 'name attempts successes failures packrat_hits time')
+
+
+class GrammarProfile(object):
+    """Per-rule counters for the grammar elements matched during parsing."""
+
+    def __init__(self):
+        self._counts = OrderedDict()
+        self._names = {}
+        self._starts = []
+
+    def __repr__(self):
+        return '<GrammarProfile: {0} rules>'.format(len(self._counts))
+
+    @contextmanager
+    def recording(self, elements):
+        """Context manager that profiles the given grammar elements while it
+        is active."""
+        cache = ParserElement.packrat_cache
+        saved_on_hit = getattr(cache, 'on_hit', None)
+        for element in elements:
+            self._names[element] = element.name
+            self._counts.setdefault(element.name, [0, 0, 0, 0, 0.0])
+        if isinstance(cache, PackratCache):
+            cache.on_hit = self._hit
+        try:
+            with _debug_actions(elements, self._start, self._success,
+                                self._failure):
+                yield self
+        finally:
+            if isinstance(cache, PackratCache):
+                cache.on_hit = saved_on_hit
+            self._names = {}
+            self._starts = []
+
+    def stats(self, sort_by='time'):
+        """Returns a list of RuleStats tuples, one per element that was tried
+        or looked up, sorted by the field `sort_by` (in decreasing order,
+        except for 'name')."""
+        if sort_by not in RuleStats._fields:
+            raise ValueError('Unknown profile field "{}"'.format(sort_by))
+        stats = [RuleStats(name, *counts) for name, counts in self._counts.items()
+                 if counts[0] or counts[3]]
+        descending = (sort_by != 'name')
+        return sorted(stats, key=lambda rule: getattr(rule, sort_by),
+                      reverse=descending)
+
+    def report(self, sort_by='time', limit=None):
+        """Returns the profile as a text table, at most `limit` rows long."""
+        lines = ['{:<28} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+            'rule', 'attempts', 'successes', 'failures', 'packrat', 'time (s)')]
+        for rule in self.stats(sort_by)[:limit]:
+            lines.append('{0.name:<28} {0.attempts:>10} {0.successes:>10} '
+                         '{0.failures:>10} {0.packrat_hits:>10} '
+                         '{0.time:>10.4f}'.format(rule))
+        return '\n'.join(lines)
+
+    def to_json(self, sort_by='time', limit=None):
+        """Returns the profile as a JSON list of objects, one per rule."""
+        rules = [rule._asdict() for rule in self.stats(sort_by)[:limit]]
+        return json.dumps(rules, indent=2)
+
+    def clear(self):
+        for counts in self._counts.values():
+            counts[:] = [0, 0, 0, 0, 0.0]
+
+    def _start(self, instring, loc, element):
+        self._counts[self._names[element]][0] += 1
+        self._starts.append(default_timer())
+
+    def _success(self, instring, start, end, element, tokens):
+        counts = self._counts[self._names[element]]
+        counts[1] += 1
+        counts[4] += default_timer() - self._starts.pop()
+
+    def _failure(self, instring, loc, element, exception):
+        counts = self._counts[self._names[element]]
+        counts[2] += 1
+        counts[4] += default_timer() - self._starts.pop()
+
+    def _hit(self, element):
+        name = self._names.get(element)
+        if name is not None:
+            self._counts[name][3] += 1
+
+
+class GrammarTrace(object):
+    """Trace of the grammar element matches tried during parsing.  Lines are
+    kept in memory, up to the last `size` of them, or written to the file
+    object `file` if one is given.  If `rules` is given, only the elements
+    with those names are traced."""
+
+    def __init__(self, size=10000, file=None, rules=None):
+        self.file = file
+        self.rules = frozenset(rules) if rules is not None else None
+        self._lines = deque(maxlen=size)
+
+    def __repr__(self):
+        return '<GrammarTrace: {0} lines>'.format(len(self._lines))
+
+    @contextmanager
+    def recording(self, elements):
+        """Context manager that traces the given grammar elements while it
+        is active."""
+        if self.rules is not None:
+            elements = [element for element in elements
+                        if element.name in self.rules]
+        with _debug_actions(elements, self._start, self._success, self._failure):
+            yield self
+
+    @property
+    def lines(self):
+        """The lines kept in memory, oldest first."""
+        return list(self._lines)
+
+    def clear(self):
+        self._lines.clear()
+
+    def _write(self, line):
+        if self.file is not None:
+            self.file.write(line + '\n')
+        else:
+            self._lines.append(line)
+
+    def _start(self, instring, loc, element):
+        self._write('Match {0} at loc {1}({2},{3})'.format(
+            element.name, loc, lineno(loc, instring), col(loc, instring)))
+
+    def _success(self, instring, start, end, element, tokens):
+        self._write('Matched {0} -> {1}'.format(element.name, tokens.asList()))
+
+    def _failure(self, instring, loc, element, exception):
+        self._write('Exception raised: {0}'.format(exception))
+
+
+#
+# Parse budgets.
+# .............................................................................
+# Some inputs make the grammar backtrack so much that parsing them takes a
+# very long time.  A ParseBudget puts limits on the time spent running the
+# grammar and on the number of steps it takes (i.e., attempts to match a
+# grammar element, including those answered from the packrat table).  The
+# usage for one input is counted by a BudgetMeter obtained from meter(),
+# which counts while a `with meter.running():` block is active by wrapping
+# ParserElement._parse, the method through which PyParsing matches every
+# element.  When a limit is exceeded, BudgetExceeded is raised from inside
+# the grammar.  It is deliberately not a PyParsing exception, so that the
+# grammar does not treat it as a failed match and carry on backtracking.
+
+class BudgetExceeded(Exception):
+    """Raised when a BudgetMeter goes over its budget.  The attribute
+    `reason` is 'time' or 'steps', and `loc` is the furthest position in the
+    input that the grammar had reached."""
+
+    def __init__(self, reason, loc):
+        super(BudgetExceeded, self).__init__(reason, loc)
+        self.reason = reason
+        self.loc = loc
+
+
+class ParseBudget(object):
+    """Limits on the grammar's work on one input: at most `seconds` of time
+    and `steps` steps.  Either may be None, meaning no limit."""
+
+    # The clock is only read every this many steps.
+    _clock_interval = 256
+
+    def __init__(self, seconds=None, steps=None):
+        self.seconds = seconds
+        self.steps = steps
+
+    def __repr__(self):
+        return '<ParseBudget: {0} seconds, {1} steps>'.format(self.seconds,
+                                                              self.steps)
+
+    def meter(self):
+        """Returns a new BudgetMeter for this budget."""
+        return BudgetMeter(self)
+
+
+class BudgetMeter(object):
+    """Usage of a ParseBudget, accumulated over any number of runs.  The
+    attribute `loc` is the furthest position reached in the last run."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.steps = 0
+        self.seconds = 0.0
+        self.loc = 0
+
+    @contextmanager
+    def running(self):
+        """Context manager that counts the steps and time of the grammar
+        while it is active, and raises BudgetExceeded if the budget is
+        exceeded."""
+        parse = ParserElement.__dict__['_parse']
+        max_steps = self.budget.steps
+        max_seconds = self.budget.seconds
+        interval = self.budget._clock_interval
+        self.loc = 0
+        started = default_timer()
+        if max_seconds is not None:
+            deadline = started + max_seconds - self.seconds
+        def metered(element, instring, loc, doActions=True, callPreParse=True):
+            self.steps += 1
+            if loc > self.loc:
+                self.loc = loc
+            if max_steps is not None and self.steps > max_steps:
+                raise BudgetExceeded('steps', self.loc)
+            if (max_seconds is not None and self.steps % interval == 0
+                    and default_timer() > deadline):
+                raise BudgetExceeded('time', self.loc)
+            return parse(element, instring, loc, doActions, callPreParse)
+        ParserElement._parse = metered
+        try:
+            yield self
+        finally:
+            ParserElement._parse = parse
+            self.seconds += default_timer() - started
+
+
 #
 # Debug helpers
 # .............................................................................
@@ -25,7 +25,10 @@ import inspect
 import sys
 import pdb
 import collections
-from collections import defaultdict
+import operator
+import re
+import six
+from array import array
 
 
 # MatlabNode -- base class for all parse tree nodes.
@@ -44,6 +47,7 @@ from collections import defaultdict
 # |  |  |  `- Special       # A colon or tilde character, or the string "end".
 # |  |  |
 # |  |  +- Array            # Unnamed arrays ("square-bracket" type or cell).
+# |  |  |  `- NumericArray  # Arrays of plain numbers, stored compactly.
 # |  |  |
 # |  |  +- Handle
 # |  |  |  +- FuncHandle    # A function handle, e.g., "@foo"
@@ -59,6 +63,7 @@ from collections import defaultdict
 # |  `- Operator
 # |     +- UnaryOp
 # |     +- BinaryOp
+# |     +- NaryOp         # A chain such as "a+b+c", if flattened.
 # |     +- ColonOp
 # |     `- Transpose
 # |
@@ -77,18 +82,60 @@ from collections import defaultdict
 # |
 # +--ShellCommand
 # |
-# `- Comment
-
-class MatlabNode(object):
+# +--Comment
+# |
+# `- Unparsed          # Input the parser skipped while recovering from errors.
+
+# Large models produce millions of nodes, so nodes don't have a __dict__.
+# The metaclass below gives each node class __slots__ for the names in its
+# _attr_names that its base classes don't already have (and classes that
+# need other attributes declare __slots__ themselves).  It also gives each
+# class an attribute _slots listing the slot descriptors of the class and
+# its bases, for copying and pickling, and a function _attr_values that
+# returns the values of the attributes named in _attr_names, for __eq__.
+
+_UNKNOWN = object()                     # Value of _as_string when not known.
+
+def _no_values(node):
+    return ()
+
+
+class _NodeClass(type):
+    def __new__(meta, name, bases, namespace):
+        if '__slots__' not in namespace:
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(klass.__dict__.get('__slots__', ()))
+            names = namespace.get('_attr_names') or []
+            namespace['__slots__'] = tuple(name for name in names
+                                           if name not in inherited)
+        cls = super(_NodeClass, meta).__new__(meta, name, bases, namespace)
+        cls._slots = [(slot, klass.__dict__[slot])
+                      for klass in reversed(cls.__mro__)
+                      for slot in klass.__dict__.get('__slots__', ())
+                      if slot != '_as_string']
+        names = cls._attr_names
+        cls._attr_values = staticmethod(operator.attrgetter(*names) if names
+                                        else _no_values)
+        return cls
+
+
+class MatlabNode(six.with_metaclass(_NodeClass, object)):
     '''Base class of nodes used to represent MATLAB statements as an AST.'''
 
+    __slots__ = ('_as_string',)
+
     _attr_names = None                 # Default set of node attributes.
     _visitable_attr = []               # Default list of visitable attributes.
     _location   = (0, 0)               # Location in file (tuple: line, col).
 
     # This clever __init__ is based on Section 8.11 of the Python Cookbook,
     # 3rd ed., by David Beazley and Brian K. Jones (O'Reilly Media, 2013).
+    # Nothing is known about a new node, so it sets the attributes without
+    # going through __setattr__().
     def __init__(self, *args, **kwargs):
+        object.__setattr__(self, '_as_string', _UNKNOWN)
         if not self._attr_names:
             if len(args) > 0 or len(kwargs) > 0:
                 raise TypeError('{} takes no arguments'.format(type(self)))
@@ -97,11 +144,11 @@ class MatlabNode(object):
 
         # Set all of the positional arguments:
         for name, value in zip(self._attr_names, args):
-            setattr(self, name, value)
+            object.__setattr__(self, name, value)
 
         # Set the remaining keyword arguments:
         for name in self._attr_names[len(args):]:
-            setattr(self, name, kwargs.pop(name))
+            object.__setattr__(self, name, kwargs.pop(name))
 
         # Check for any remaining unknown arguments:
         if kwargs:
@@ -116,9 +163,53 @@ class MatlabNode(object):
         return '{MatlabNode}'
 
 
+    # Nodes are used as dictionary keys (e.g., in MatlabContext), and their
+    # hash values come from the canonical strings made by as_string().  The
+    # string of a node is made once, from those of its children, and kept in
+    # the attribute '_as_string'.  Setting any attribute of a node drops its
+    # string.  MatlabNodeVisitor sets the attributes of every node it walks,
+    # so the nodes above one that changed lose theirs as well.  Code that
+    # changes a node in some other way, such as by appending to one of its
+    # lists, must call invalidate() on that node and the nodes above it.
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, '_as_string', _UNKNOWN)
+        object.__setattr__(self, name, value)
+
+
+    def invalidate(self):
+        """Forgets the canonical string of this node (see as_string()),
+        after a change that did not go through setting an attribute."""
+        object.__setattr__(self, '_as_string', _UNKNOWN)
+
+
+    def __getstate__(self):
+        # For copy and pickle.  The slots are read through their descriptors
+        # because subclasses may hide them (e.g., NumericArray.rows).
+        state = {}
+        for name, slot in self._slots:
+            try:
+                state[name] = slot.__get__(self)
+            except AttributeError:
+                pass
+        return state
+
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_as_string', _UNKNOWN)
+        for name, slot in self._slots:
+            if name in state:
+                slot.__set__(self, state[name])
+
+
     def __eq__(self, other):
-        return (isinstance(other, self.__class__)
-                and self.__dict__ == other.__dict__)
+        if self is other:
+            return True
+        if not isinstance(other, self.__class__):
+            return False
+        # The kept strings are not compared: a node's string can be out of
+        # date after a change to one of its children in place.
+        return self._attr_values(self) == self._attr_values(other)
 
 
     def __ne__(self, other):
@@ -173,7 +264,51 @@ class MatlabNode(object):
         This is a recursive function, and is meant to be used to convert simple
         node structures (such as array accesses) into dictionary hash keys.
         It is unlikely to yield useful results for more complicated node trees.
+        The string of a node is kept until the node is changed.
         """
+        if isinstance(thing, MatlabNode):
+            if thing._as_string is _UNKNOWN:
+                MatlabNode._make_strings(thing)
+            return thing._as_string
+        return MatlabNode._make_string(thing)
+
+
+    @staticmethod
+    def _make_strings(node):
+        # Makes and keeps the strings of `node` and of the expressions below
+        # it whose strings are not known, deepest first, so that making each
+        # one only takes the strings of its children from their nodes.  This
+        # uses a stack instead of recursion because expressions such as long
+        # sums can be nested very deeply.
+        stack = [(node, False)]
+        while stack:
+            node, ready = stack.pop()
+            if ready:
+                if node._as_string is _UNKNOWN:
+                    object.__setattr__(node, '_as_string',
+                                       MatlabNode._make_string(node))
+                continue
+            stack.append((node, True))
+            if not isinstance(node, Expression):
+                continue
+            values = [getattr(node, name, None) for name in node._visitable_attr]
+            while values:
+                value = values.pop()
+                if isinstance(value, MatlabNode):
+                    if value._as_string is not _UNKNOWN:
+                        pass
+                    elif value._visitable_attr:
+                        stack.append((value, False))
+                    else:
+                        object.__setattr__(value, '_as_string',
+                                           MatlabNode._make_string(value))
+                elif isinstance(value, (list, tuple)):
+                    values.extend(value)
+
+
+    @staticmethod
+    def _make_string(thing):
+        # Does the work of as_string(), which it uses for the children.
         def row_to_string(row):
             list = [MatlabNode.as_string(item) for item in row]
             return ','.join(list)
@@ -202,6 +337,9 @@ class MatlabNode(object):
         elif isinstance(thing, StructRef):
             base = MatlabNode.as_string(thing.name)
             return base + '.' + MatlabNode.as_string(thing.field)
+        elif isinstance(thing, NumericArray):
+            rowlist = [','.join(row) for row in thing.text_rows()]
+            return '[' + ';'.join(rowlist) + ']'
         elif isinstance(thing, Array):
             rowlist = [row_to_string(row) for row in thing.rows]
             return '[' + ';'.join(rowlist) + ']'
@@ -212,6 +350,9 @@ class MatlabNode(object):
                 left = MatlabNode.as_string(thing.left)
                 right = MatlabNode.as_string(thing.right)
                 return left + thing.op + right
+            elif isinstance(thing, NaryOp):
+                return thing.op.join(MatlabNode.as_string(operand)
+                                     for operand in thing.operands)
             elif isinstance(thing, ColonOp):
                 left = MatlabNode.as_string(thing.left)
                 right = MatlabNode.as_string(thing.right)
@@ -332,6 +473,128 @@ class Array(Entity):
                 return '{array: [] }'
 
 
+    def __eq__(self, other):
+        return (isinstance(other, Array) and self.is_cell == other.is_cell
+                and self.rows == other.rows)
+
+
+    def __hash__(self):
+        return MatlabNode.__hash__(self)
+
+
+class NumericArray(Array):
+    """A square-bracket array whose elements are all plain numbers, such as
+    [0.1 0.2; 0.3 0.4].  Such arrays can be very large in some models (e.g.,
+    initial conditions), so they are stored compactly instead of as a Number
+    node per element.  The field `shape` is the tuple (rows, columns),
+    `values` is an array('d') of the numbers in row-major order, and `text`
+    is the text of the array between the brackets.  The text forms of the
+    numbers (i.e., the values their Number nodes would have) are obtained
+    from `text` when needed, using `texts` or `text_rows()`.
+
+    A NumericArray otherwise behaves like the equivalent Array.  Reading
+    `rows` creates new Number nodes every time, so code that only needs the
+    numbers should avoid it, and changing those nodes does not change the
+    array (set `texts` for that).  Visitors do not descend into the rows."""
+    __slots__ = ('shape', 'values', 'text', '_texts')
+    _attr_names = ['shape', 'values', 'text']
+    _visitable_attr = []
+    is_cell = False
+
+    # The text is known to be a valid array of numbers, so the elements are
+    # simply whatever is between separators.
+    _element_re = re.compile(r'[^\s,;]+')
+    _row_sep_re = re.compile(r'[;\n]')
+
+
+    def __init__(self, *args, **kwargs):
+        super(NumericArray, self).__init__(*args, **kwargs)
+        object.__setattr__(self, '_texts', None)
+
+
+    @classmethod
+    def from_text(cls, text):
+        """Returns a NumericArray for `text`, the contents of an array of
+        numbers without the brackets, or None if its rows are not all the
+        same length.  Numbers may use D or d for the exponent."""
+        rows = [row for row in cls._row_sep_re.split(text) if row.strip()]
+        lengths = set(len(cls._element_re.findall(row)) for row in rows)
+        if len(lengths) != 1:
+            return None
+        values = cls._to_values(cls._element_re.findall(text))
+        return cls(shape=(len(rows), lengths.pop()), values=values, text=text)
+
+
+    @staticmethod
+    def _to_values(texts):
+        return array('d', [float(item.replace('d', 'e').replace('D', 'e'))
+                           for item in texts])
+
+
+    @property
+    def texts(self):
+        """The text forms of the numbers, in row-major order.  Setting this
+        replaces the numbers, keeping the shape."""
+        return list(self._text_list())
+
+
+    @texts.setter
+    def texts(self, texts):
+        ncols = self.shape[1]
+        rows = [' '.join(texts[i:i + ncols]) for i in range(0, len(texts), ncols)]
+        self.text = ';'.join(rows)
+        self.values = self._to_values(texts)
+        self._texts = None
+
+
+    def _text_list(self):
+        # The texts are found once for each value of `text`, and kept along
+        # with it, so that a new value of `text` is noticed however it is set.
+        # Callers must not change the list returned.
+        kept = self._texts
+        if kept is None or kept[0] is not self.text:
+            found = [item.lstrip('+') for item in self._element_re.findall(self.text)]
+            kept = (self.text, found)
+            object.__setattr__(self, '_texts', kept)
+        return kept[1]
+
+
+    def text_rows(self):
+        """Returns the text forms of the numbers as a list of rows."""
+        texts = self._text_list()
+        ncols = self.shape[1]
+        return [texts[i:i + ncols] for i in range(0, len(texts), ncols)]
+
+
+    @property
+    def rows(self):
+        return self._number_rows()
+
+
+    def _number_rows(self):
+        return [[Number(value=item) for item in row] for row in self.text_rows()]
+
+
+    def __repr__(self):
+        return 'Array(is_cell=False, rows={})'.format(self._number_rows())
+
+
+    def __str__(self):
+        return '{{array: [ {} ]}}'.format(_str_format_rowlist(self._number_rows()))
+
+
+    def __eq__(self, other):
+        if isinstance(other, NumericArray):
+            return (self.shape == other.shape
+                    and self._text_list() == other._text_list())
+        return (isinstance(other, Array) and not other.is_cell
+                and self._number_rows() == other.rows)
+
+
+    def __hash__(self):
+        return MatlabNode.__hash__(self)
+
+
 #
 # Handles
 #
@@ -546,6 +809,22 @@ class BinaryOp(Operator):
             self.op, _str_format(self.left), _str_format(self.right))
 
 
+class NaryOp(Operator):
+    '''Chain of the same associative operator (+, *, && or ||), such as
+    a+b+c, made by OperatorFlattener from nested BinaryOp nodes.  The field
+    `operands` is the list of operands in order.'''
+    _attr_names = ['op', 'operands']
+    _visitable_attr = ['operands']
+
+    def __repr__(self):
+        return 'NaryOp(op=\'{}\', operands={})'.format(self.op,
+                                                       repr(self.operands))
+
+    def __str__(self):
+        return '{{n-ary op expression {} operands {}}}'.format(
+            self.op, _str_format_args(self.operands))
+
+
 class ColonOp(Operator):
     '''MATLAB "colon" operator, of the form x:y or x:y:z.'''
     _attr_names = ['left', 'middle', 'right']
@@ -765,6 +1044,25 @@ class Comment(MatlabNode):
         return '{{comment: {}}}'.format(self.content)
 
 
+# Unparsed input.
+# .........................................................................
+
+class Unparsed(MatlabNode):
+    '''Text that could not be parsed, left in place of the statement(s) by
+    MatlabParser in error recovery mode.  The lines of the input it spans
+    are `first_line` to `last_line`, and `message` describes the error.'''
+    _attr_names = ['text', 'message', 'first_line', 'last_line']
+
+    def __repr__(self):
+        return 'Unparsed(text={}, message={}, first_line={}, last_line={})'.format(
+            repr(self.text), repr(self.message), self.first_line, self.last_line)
+
+    def __str__(self):
+        return '{{unparsed: lines {}-{}: {}}}'.format(self.first_line,
+                                                      self.last_line,
+                                                      self.message)
+
+
 # Visitor.
 # .........................................................................
 # This is a visitor class with special powers:
@@ -804,66 +1102,223 @@ class Comment(MatlabNode):
 # Note that no visit_MatlabNode() will ever get called, because there is no
 # point: the method visit() is effectively visit_MatlabNode().
 
+# The method to call for a given class of node depends only on the classes
+# of the visitor and the node, so it is looked up once for each pair and kept
+# in a table belonging to the visitor class.  The superclasses of each node
+# class (not counting MatlabNode) are likewise listed once, in _superclasses.
+
+_superclasses = {}
+
+def _node_superclasses(cls):
+    if cls not in _superclasses:
+        _superclasses[cls] = [c for c in cls.__mro__[1:]
+                              if issubclass(c, MatlabNode) and c is not MatlabNode]
+    return _superclasses[cls]
+
+
 class MatlabNodeVisitor(object):
     def __init__(self):
-        def catalog(this_class, classes):
-            # Note it doesn't help to put MatlabNode in the path because it
-            # bloats the list and complicates processing later, so we skip it.
-            for subclass in this_class.__subclasses__():
-                if this_class in classes:
-                    classes[subclass] = [this_class] + classes[this_class]
-                elif this_class is not MatlabNode:
-                    classes[subclass] = [this_class]
-                catalog(subclass, classes)
-
-        # Cache the superclass path for every subclass, so that we don't have
-        # to keep walking up the class hierarchy at every call to visit().
-        self._parent_classes = defaultdict(list)
-        catalog(MatlabNode, self._parent_classes)
+        # All instances of a visitor class share one table of methods.
+        cls = type(self)
+        table = cls.__dict__.get('_methods')
+        if table is None:
+            table = {}
+            cls._methods = table
+        self._methods = table
 
 
     def visit(self, node):
         if not node:
             return node
-        elif isinstance(node, list):
-            meth = getattr(self, 'visit_list', None)
-            if meth is None:
-                meth = self.default_visit_list
-            return meth(node)
-        elif isinstance(node, tuple):
-            return (self.visit(node[0]), self.visit(node[1]))
-        else:
-            # If the user has defined a method for this class of object, call
-            # that; else, look for a method for a superclass, and failing all
-            # that, default to walking the visitable attributes.
-            methname = 'visit_' + type(node).__name__
-            meth = getattr(self, methname, None)
+        try:
+            meth = self._methods[type(node)]
+        except KeyError:
+            meth = self._methods[type(node)] = self._find_method(type(node))
+        return meth(self, node)
+
+
+    def _find_method(self, node_class):
+        # Returns the function to call for nodes of class `node_class`.
+        # Where that would be one of the default methods below, and the
+        # visitor class has not redefined it, it is _walk() instead.
+        cls = type(self)
+        if issubclass(node_class, list):
+            meth = getattr(cls, 'visit_list', None)
             if meth:
-                return meth(node)
-            else:
-                for superclass in self._parent_classes[node.__class__]:
-                    methname = 'visit_' + superclass.__name__
-                    meth = getattr(self, methname, None)
-                    if meth:
-                        return meth(node)
-                # We got 'nothin.  We do the default walk.
-                meth = self.default_visit
-                return meth(node)
+                return meth
+            return _default_or_walk(cls, 'default_visit_list')
+        elif issubclass(node_class, tuple):
+            return _walk
+        # If the user has defined a method for this class of object, use
+        # that; else, look for a method for a superclass, and failing all
+        # that, default to walking the visitable attributes.
+        for klass in [node_class] + _node_superclasses(node_class):
+            meth = getattr(cls, 'visit_' + klass.__name__, None)
+            if meth:
+                return meth
+        return _default_or_walk(cls, 'default_visit')
+
+
+    def _walk(self, node):
+        # Does what default_visit() and default_visit_list() do, and what
+        # visit() does for tuples, but for everything below `node` that
+        # would be handled by them as well, using a stack of walkers in
+        # place of recursion.  Other methods are called as usual.  Deep
+        # expressions such as long sums would otherwise take several levels
+        # of recursion per node.
+        methods = self._methods
+        walker = _walker(node)
+        stack = []
+        while True:
+            child = walker.next()
+            if child is _NOTHING:
+                value = walker.result()
+                if not stack:
+                    return value
+                walker = stack.pop()
+                walker.accept(value)
+                continue
+            if child:
+                try:
+                    meth = methods[type(child)]
+                except KeyError:
+                    meth = methods[type(child)] = self._find_method(type(child))
+                if meth is _walk:
+                    stack.append(walker)
+                    walker = _walker(child)
+                    continue
+                child = meth(self, child)
+            walker.accept(child)
 
 
     def default_visit(self, node):
         """Default visitor.  Users can redefine this if desired."""
-        for a in type(node)._visitable_attr:
-            value = getattr(node, a, None)
-            if value:
-                setattr(node, a, self.visit(value))
-        return node
+        return self._walk(node)
 
 
     def default_visit_list(self, node):
         """Default visitor for lists.  Users can redefine this if desired."""
-        visited = [self.visit(item) for item in node]
-        return [x for x in visited if x is not None]
+        return self._walk(node)
+
+
+_walk = MatlabNodeVisitor.__dict__['_walk']
+
+def _default_or_walk(cls, name):
+    meth = getattr(cls, name)
+    if getattr(meth, '__func__', meth) is MatlabNodeVisitor.__dict__[name]:
+        return _walk
+    return meth
+
+
+# The walkers used by MatlabNodeVisitor._walk().  Each one goes through the
+# things to visit below one node, list or tuple: next() returns the next one
+# (or _NOTHING when there are no more), accept() takes the result of visiting
+# it, and result() returns what visiting the node, list or tuple returns.
+
+_NOTHING = object()
+
+def _walker(thing):
+    if isinstance(thing, list):
+        return _ListWalker(thing)
+    elif isinstance(thing, tuple):
+        return _ListWalker(thing[:2], tuple)
+    else:
+        return _NodeWalker(thing)
+
+
+class _NodeWalker(object):
+    __slots__ = ('node', 'names', 'name')
+
+    def __init__(self, node):
+        self.node = node
+        self.names = iter(type(node)._visitable_attr)
+
+    def next(self):
+        for name in self.names:
+            value = getattr(self.node, name, None)
+            if value:
+                self.name = name
+                return value
+        return _NOTHING
+
+    def accept(self, value):
+        setattr(self.node, self.name, value)
+
+    def result(self):
+        return self.node
+
+
+class _ListWalker(object):
+    __slots__ = ('items', 'visited', 'kind')
+
+    def __init__(self, items, kind=list):
+        self.items = iter(items)
+        self.visited = []
+        self.kind = kind
+
+    def next(self):
+        return next(self.items, _NOTHING)
+
+    def accept(self, value):
+        self.visited.append(value)
+
+    def result(self):
+        if self.kind is tuple:
+            return tuple(self.visited)
+        return [x for x in self.visited if x is not None]
+
+
+class LeafSharer(MatlabNodeVisitor):
+    """Replaces Identifier and Number nodes by the first equal node of the
+    same class that it has visited, so that each distinct name and number
+    is stored once.  Files tend to use the same few names over and over, so
+    this saves a good deal of memory on large inputs.  The shared nodes must
+    then be treated as immutable: changing one changes it everywhere."""
+
+    def __init__(self):
+        super(LeafSharer, self).__init__()
+        self._leaves = {}
+
+
+    def visit_Identifier(self, node):
+        return self._leaves.setdefault((type(node), node.name), node)
+
+
+    def visit_Number(self, node):
+        return self._leaves.setdefault((type(node), node.value), node)
+
+
+class OperatorFlattener(MatlabNodeVisitor):
+    """Replaces chains of three or more operands joined by the same
+    associative operator (+, *, && or ||) with NaryOp nodes.  The parser
+    nests such chains to the left, e.g., a+b+c is BinaryOp(op='+',
+    left=BinaryOp(op='+', left=a, right=b), right=c), so a long sum is as
+    deep as it is long.  Only left operands are merged, so that the
+    operands keep the order in which MATLAB would evaluate them."""
+
+    associative = ('+', '*', '&&', '||')
+
+    def visit_BinaryOp(self, node):
+        # Go down the left operands first, without recursing, then build
+        # the result back up.  Operands are visited left to right.
+        chain = [node]
+        while isinstance(chain[-1].left, BinaryOp):
+            chain.append(chain[-1].left)
+        result = self.visit(chain[-1].left)
+        group = None
+        for link in reversed(chain):
+            right = self.visit(link.right)
+            if group is not None and group.op == link.op \
+               and link.op in self.associative:
+                if isinstance(group, BinaryOp):
+                    group = NaryOp(op=link.op, operands=[group.left, group.right])
+                group.operands.append(right)
+            else:
+                link.left = result
+                link.right = right
+                group = link
+            result = group
+        return result
 
 
 # General helpers.
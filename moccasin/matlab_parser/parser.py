@@ -73,6 +73,7 @@
 # |  |  |  `- Special       # A colon or tilde character, or the string "end".
 # |  |  |
 # |  |  +- Array            # Unnamed arrays ("square-bracket" type or cell).
+# |  |  |  `- NumericArray  # Arrays of plain numbers, stored compactly.
 # |  |  |
 # |  |  +- Handle
 # |  |  |  +- FuncHandle    # A function handle, e.g., "@foo"
@@ -88,6 +89,7 @@
 # |  `- Operator
 # |     +- UnaryOp
 # |     +- BinaryOp
+# |     +- NaryOp         # A chain such as "a+b+c", if flattened.
 # |     +- ColonOp
 # |     `- Transpose
 # |
@@ -126,7 +128,9 @@
 #   - `Array` objects are also literal values, but are structured.  `Array`
 #      objects may be regular arrays or cell arrays.  In this parser, both
 #      types of arrays are treated essentially identically, with only a
-#      Boolean attribute (`is_cell`) in `Array` to distinguish them.
+#      Boolean attribute (`is_cell`) in `Array` to distinguish them.  Arrays
+#      containing only numbers are returned as the `Array` subclass
+#      `NumericArray`, which stores the numbers compactly.
 #
 #   - `Handle` objects in some ways are similar to `Primitive` objects and in
 #      other ways similar to `Reference`.  They have an implication of being
@@ -358,7 +362,10 @@
 from __future__ import print_function
 import codecs
 import copy
+import functools
+import io
 import pdb
+import re
 import six
 import sys
 import traceback
@@ -366,13 +373,16 @@ import pyparsing                        # Need this for version check, so ...
 from pyparsing import *                 # ... DON'T merge this & previous stmt!
 from distutils.version import LooseVersion
 from collections import defaultdict
+from contextlib import contextmanager
 try:
     from grammar_utils import *
+    from cache import *
     from context import *
     from matlab import *
     from functions import *
 except:
     from .grammar_utils import *
+    from .cache import *
     from .context import *
     from .matlab import *
     from .functions import *
@@ -382,13 +392,11 @@ except:
 if LooseVersion(pyparsing.__version__) < LooseVersion('2.0.3'):
     raise Exception('MatlabParser requires PyParsing version 2.0.3 or higher')
 
-# Necessary optimization.  Without this, the PyParsing grammar defined below
-# never finishes parsing anything.
-
-ParserElement.enablePackrat(cache_size_limit = None)
-
-# The inefficient nature of this parser leads to easily exceeding the default
-# recursion stack limit.  Let's increase it:
+# PyParsing matches the grammar by recursive descent, so deeply nested input
+# (e.g., parentheses within parentheses) easily exceeds the default recursion
+# stack limit.  Let's increase it.  Our own traversals of the node trees don't
+# need this: as_string(), make_formula(), MatlabNodeVisitor's default methods
+# and the conversion of operator chains use stacks instead of recursion.
 
 sys.setrecursionlimit(5000)
 
@@ -401,6 +409,22 @@ class MatlabParsingException(Exception):
     pass
 
 
+class MatlabParsingBudgetException(MatlabParsingException):
+    """Raised when parsing an input exceeds the parser's ParseBudget.  The
+    attribute `reason` is 'time' or 'steps', and `loc`, `line` and `col` give
+    the furthest position that the parser had reached.  When the parser
+    works on pieces of the input (see MatlabParser), `loc` is relative to
+    the piece, but `line` is always a line of the whole input."""
+
+    def __init__(self, reason, loc, line, col):
+        msg = 'Parse {0} budget exceeded at line {1}, column {2}'
+        super(MatlabParsingBudgetException, self).__init__(msg.format(reason, line, col))
+        self.reason = reason
+        self.loc = loc
+        self.line = line
+        self.col = col
+
+
 class MatlabInternalException(Exception):
     pass
 
@@ -409,6 +433,19 @@ class MatlabInternalException(Exception):
 # Helper classes
 # .............................................................................
 
+# _Formula
+#
+# Used by MatlabParser.make_formula() to remember, on its stack, how to make
+# the formula of a thing once the formulas of its `count` parts are done.
+
+class _Formula(object):
+    __slots__ = ('count', 'build')
+
+    def __init__(self, count, build):
+        self.count = count
+        self.build = build
+
+
 # ParseResultsTransformer
 #
 # Helper class to transform ParseResults to MatlabNode-based output format.
@@ -427,15 +464,21 @@ class MatlabInternalException(Exception):
 # @dispatch.on and @visit.when annotations that are floating around on the
 # net, but can't: the objects we're processing are always ParseResults (a
 # single class), so the class-based @visit.when dispatching won't work here.
+#
+# The transformer is not run over the complete parse results.  Instead, it
+# is invoked by a parse action (statements_to_nodes(), below) each time a
+# statement is matched, so statements are converted while parsing proceeds
+# and the ParseResults for a whole file never exist at once.  Statements
+# nested inside other statements are therefore already MatlabNode objects
+# by the time their parent is converted; visit() passes them through.
+# Function definitions don't get their contexts here, because parse actions
+# run bottom-up; MatlabParser._attach_contexts() does that after parsing.
 
 class ParseResultsTransformer:
-    def __init__(self, parser):
-        self._parser = parser
-
-
     def visit(self, pr):
         if not isinstance(pr, ParseResults):
-            # It's a terminal element, so we don't do anything more.
+            # It's a terminal element or an already-converted node, so we
+            # don't do anything more.
             return pr
 
         length = len(pr)
@@ -492,6 +535,11 @@ class ParseResultsTransformer:
         return String(value=pr['string'])
 
 
+    def visit_numeric_array(self, pr):
+        # The parse action on _NUMERIC_ARRAY already made the node.
+        return pr['numeric array']
+
+
     def visit_tilde(self, pr):
         return Special(value='~')
 
@@ -525,11 +573,27 @@ class ParseResultsTransformer:
 
 
     def visit_binary_operator(self, pr):
-        op_key = first_key(pr[1])
-        op = pr[1][op_key]
-        left = self.visit(pr[0])
-        right = self.visit(pr[2])
-        return BinaryOp(op=op, left=left, right=right)
+        # Long sums and the like are nested to the left, one level per
+        # operator (see makeLRlike() in grammar_utils.py).  Rather than
+        # recursing down the left operands, this follows them down first
+        # and then builds the nodes back up, visiting the right operands in
+        # the same order that recursion would.
+        chain = [pr]
+        while self._is_binary_operation(chain[-1][0]):
+            chain.append(chain[-1][0])
+        node = self.visit(chain[-1][0])
+        for pr in reversed(chain):
+            op = pr[1][first_key(pr[1])]
+            node = BinaryOp(op=op, left=node, right=self.visit(pr[2]))
+        return node
+
+
+    @staticmethod
+    def _is_binary_operation(pr):
+        # Must agree with the tests in visit().
+        return (isinstance(pr, ParseResults) and len(pr) == 3 and empty_dict(pr)
+                and not pr[1].get('transpose')
+                and 'binary operator' in pr[1].keys())
 
 
     def visit_colon_operator(self, pr):
@@ -632,13 +696,8 @@ class ParseResultsTransformer:
 
 
     def visit_function_definition(self, pr):
-        # Processing function definitions requires extra work.  MATLAB
-        # functions establish contexts for other constructs and we need to
-        # build a dynamic stack to track those contexts.  This is done here
-        # by pushing a context object before we process the function
-        # definition body, so that the constructs in the body are processed
-        # in the appropriate context.
-
+        # MATLAB functions establish contexts for other constructs.  The
+        # context field is filled in later by MatlabParser._attach_contexts().
         content = pr['function definition']
         name = self.visit(content['name'])
 
@@ -649,25 +708,12 @@ class ParseResultsTransformer:
         if 'output list' in content:
             output = self._convert_list(content['output list'])
 
-        # Chicken, meet egg.  So: create an incomplete FunDef, use it to
-        # create a context object, and then set the FunDef's context field.
-        fundef = FunDef(name=name, parameters=params, output=output,
-                        body=None, context=None)
-        fundef.context = self._parser._save_function_definition(fundef)
-        self._parser._push_context(fundef.context)
-
-        # Now process the body, having set the context.
         body = None
         if 'body' in content:
             body = self._convert_list(content['body'])
 
-        # Go back and complete the function definition object.
-        fundef.body = body
-
-        # And finally, pop the context before returning.
-        self._parser._pop_context()
-
-        return fundef
+        return FunDef(name=name, parameters=params, output=output,
+                      body=body, context=None)
 
 
     def visit_ambiguous_id(self, pr):
@@ -820,6 +866,43 @@ class ParseResultsTransformer:
         return [node for node in nodelist if node]
 
 
+# Parse action attached to the statement-level alternatives of the grammar
+# (_stmt_list, _fun_body and _matlab in MatlabParser).  The transformer has
+# no state, so a single instance serves all parsers.
+
+_statement_transformer = ParseResultsTransformer()
+
+def _statements_to_nodes(s, loc, toks):
+    return [_statement_transformer.visit(item) for item in toks]
+
+
+# Parse action attached to _NUMERIC_ARRAY in MatlabParser.  Arrays whose
+# rows differ in length are rejected here, so that _bare_array gets them.
+
+def _text_to_numeric_array(s, loc, toks):
+    node = NumericArray.from_text(toks[0][1:-1])
+    if node is None:
+        raise ParseException(s, loc, 'Array rows differ in length')
+    return node
+
+
+# Worker function for MatlabParser._parallel_parse().  It runs in a separate
+# process, so it returns everything as values: the nodes for the chunk, the
+# packrat statistics, and the position (in the chunk as given) and message
+# of the parsing error, if there was one.
+
+def _parse_chunk(task):
+    chunk, style, packrat = task
+    parser = MatlabParser(packrat=packrat)
+    grammar = parser._grammar_for_style(style)
+    preprocessed, offsets = parser._preprocess(chunk)
+    try:
+        pr = parser._run_grammar(grammar, preprocessed, offsets, chunk)
+    except ParseBaseException as err:
+        return None, parser.packrat_stats, (err.loc, err.msg)
+    return list(pr), parser.packrat_stats, None
+
+
 
 # NodeTransformer
 #
@@ -1112,6 +1195,212 @@ class Disambiguator(MatlabNodeVisitor):
         return node
 
 
+
+# FastPath
+#
+# Helper class that recognizes the most common trivial statements directly:
+# blank lines, line comments, and assignments to a variable of either an
+# arithmetic formula over numbers and identifiers or an array of numbers,
+# on one line and optionally followed by a line comment, as in
+#
+#     k1 = 0.0058 * 60;    % per minute
+#     x0 = [0; 0];
+#
+# These make up most of the lines of typical ODE models, and going through
+# the full grammar for each of them is comparatively expensive.  The nodes
+# built here are the ones the grammar and ParseResultsTransformer produce for
+# the same text, including the precedence of unary operators relative to
+# powers and the folding of signs into numbers.  Anything else (function
+# calls, strings, transposes, arrays with formulas in them, continuations,
+# and so on) makes parse() return None, and the caller then uses the
+# grammar.  Counts of both cases are kept in the attributes `hits` and
+# `misses`.
+
+class _NotSimple(Exception):
+    pass
+
+
+class FastPath(object):
+    _statement = re.compile(r'[ \t]*(?:(?P<lhs>[A-Za-z][A-Za-z0-9_]*)[ \t]*=(?!=)'
+                            r'[ \t]*(?:\[(?P<array>[- \t+.,;0-9EeDd]*)\][ \t]*'
+                            r'|(?P<rhs>[^%;,\n\[\]]*))(?:[;,][ \t]*)?)?'
+                            r'(?:%(?P<comment>[^\n]*))?\n?\Z')
+    _spaces    = re.compile(r'[ \t]*\Z')
+    _addsub    = ['+', '-']
+    _muldiv    = ['*', '/', '\\', '.*', './', '.\\']
+    _powers    = ['^', '.^']
+
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # The grammar is defined further down in this file.
+        self._token = re.compile(r'[ \t]*(?:(?P<number>{0})'
+                                 r'|(?P<name>[A-Za-z][A-Za-z0-9_]*)'
+                                 r'|(?P<op>\.[*/\\^]|[-+*/\\^()]))'
+                                 .format(MatlabParser._number_re))
+        self._numeric_array = re.compile(MatlabParser._numeric_array_re + r'\Z')
+        self._keywords = frozenset(MatlabParser._keywords)
+
+
+    def __repr__(self):
+        return '<FastPath: {0} hits, {1} misses>'.format(self.hits, self.misses)
+
+
+    def parse(self, text):
+        """Returns the list of nodes for the statement in `text`, or None if
+        it isn't simple enough for this class to handle."""
+        nodes = self._parse(text)
+        if nodes is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return nodes
+
+
+    def _parse(self, text):
+        match = self._statement.match(text)
+        if not match or match.group('lhs') in self._keywords:
+            return None
+        comment = match.group('comment')
+        # Block comments, and tabs and carriage returns (which the grammar
+        # gets to see in a rewritten form), are left to the grammar.
+        if comment is not None and (comment[:1] in ['{', '}']
+                                    or '\t' in comment or '\r' in comment):
+            return None
+        nodes = []
+        if match.group('lhs'):
+            try:
+                if match.group('array') is not None:
+                    rhs = self._array(match.group('array'))
+                else:
+                    self._tokens = self._tokenize(match.group('rhs'))
+                    self._next = 0
+                    rhs = self._sum()
+                    if self._next != len(self._tokens):
+                        return None
+            except _NotSimple:
+                return None
+            finally:
+                self._tokens = None
+            nodes.append(Assignment(lhs=Identifier(name=match.group('lhs')),
+                                    rhs=rhs))
+        if comment is not None:
+            nodes.append(Comment(content=comment))
+        return nodes
+
+
+    def _array(self, text):
+        # Arrays of numbers are recognized the same way as in the grammar
+        # (see _NUMERIC_ARRAY in MatlabParser).
+        if not text.strip(' \t'):
+            return Array(rows=[], is_cell=False)
+        if not self._numeric_array.match('[' + text + ']'):
+            raise _NotSimple()
+        node = NumericArray.from_text(text)
+        if node is None:
+            raise _NotSimple()
+        return node
+
+
+    def _tokenize(self, text):
+        tokens = []
+        position = 0
+        while not self._spaces.match(text, position):
+            match = self._token.match(text, position)
+            if not match:
+                raise _NotSimple()
+            kind = match.lastgroup
+            if kind == 'name' and match.group(kind) in self._keywords:
+                raise _NotSimple()
+            tokens.append((kind, match.group(kind)))
+            position = match.end()
+        return tokens
+
+
+    def _peek(self):
+        if self._next < len(self._tokens):
+            return self._tokens[self._next]
+        return (None, None)
+
+
+    def _take(self):
+        token = self._peek()
+        if token[0] is None:
+            raise _NotSimple()
+        self._next += 1
+        return token
+
+
+    def _sum(self):
+        left = self._product()
+        while self._peek()[1] in self._addsub:
+            op = self._take()[1]
+            left = BinaryOp(op=op, left=left, right=self._product())
+        return left
+
+
+    def _product(self):
+        left = self._unary()
+        while self._peek()[1] in self._muldiv:
+            op = self._take()[1]
+            left = BinaryOp(op=op, left=left, right=self._unary())
+        return left
+
+
+    def _unary(self):
+        # Unary operators bind less tightly than powers: -2^2 is -(2^2).
+        if self._peek()[1] in self._addsub:
+            op = self._take()[1]
+            if self._peek()[1] in self._addsub:
+                raise _NotSimple()
+            return self._signed(op, self._power())
+        return self._power()
+
+
+    def _power(self):
+        left = self._primary()
+        while self._peek()[1] in self._powers:
+            op = self._take()[1]
+            # A sign right after a power operator applies to the operand
+            # only: 2^-2*3 is (2^(-2))*3.
+            if self._peek()[1] in self._addsub:
+                sign = self._take()[1]
+                right = self._signed(sign, self._primary())
+            else:
+                right = self._primary()
+            left = BinaryOp(op=op, left=left, right=right)
+        return left
+
+
+    def _primary(self):
+        kind, value = self._take()
+        if kind == 'number':
+            return Number(value=value)
+        elif kind == 'name':
+            return Ambiguous(name=Identifier(name=value), args=None)
+        elif value == '(':
+            node = self._sum()
+            if self._take()[1] != ')':
+                raise _NotSimple()
+            return node
+        raise _NotSimple()
+
+
+    def _signed(self, op, operand):
+        # Same as ParseResultsTransformer.visit_unary_operator().
+        if not op:
+            return operand
+        elif isinstance(operand, Number):
+            if op == '+':
+                return Number(value=operand.value)
+            elif operand.value.startswith('-'):
+                return Number(value=operand.value[1:])
+            else:
+                return Number(value=op + operand.value)
+        return UnaryOp(op=op, operand=operand)
+
+
 
 # MatlabParser.
 # .............................................................................
@@ -1156,23 +1445,29 @@ class MatlabParser:
 
     ParserElement.setDefaultWhitespaceChars(' \t\n\r')
 
+    # Terminals that come in many variants (numbers, identifiers, reserved
+    # words, groups of operators) are matched using a single compiled regular
+    # expression each, rather than combinations of PyParsing objects.  This
+    # matters because terminal matching is a large share of parse time, and
+    # every PyParsing object involved in a match costs a method call and a
+    # packrat cache lookup.  Where a regular expression replaces a "|"
+    # combination, the alternatives are kept in the same order, because the
+    # first match wins in both cases; where it replaces a "^" combination,
+    # longer alternatives come first, because the longest match wins.
+    #
     # This definition of numbers knowingly ignores imaginary numbers because
-    # they're not used in our domain.
+    # they're not used in our domain.  Note that the order of alternatives
+    # means "1.*2" is read as "1." times 2.
 
-    _INTEGER    = Word(nums)
-    _EXPONENT   = Combine(oneOf('E e D d') + Optional(oneOf('+ -')) + Word(nums))
-    _FLOAT      = (Combine(Word(nums) + Optional('.' + Word(nums)) + _EXPONENT)
-                   | Combine(Word(nums) + '.' + _EXPONENT)
-                   | Combine(Word(nums) + '.' + Word(nums))
-                   | Combine('.' + Word(nums) + _EXPONENT)
-                   | Combine('.' + Word(nums))
-                   | Combine(Word(nums) + '.'))
+    _exponent   = r'[EeDd][-+]?\d+'
+    _number_re  = (r'\d+(?:\.\d+)?{0}|\d+\.{0}|\d+\.\d+|\.\d+{0}|\.\d+|\d+\.|\d+'
+                   .format(_exponent))
 
     # Next come definitions of terminal elements.  The funky syntax with the
     # second parenthesized argument on each line is something PyParsing allows;
     # it's a short form, equivalent to calling .setResultsName(...).
 
-    _NUMBER     = (_FLOAT | _INTEGER)                 ('number')
+    _NUMBER     = Regex(_number_re)                   ('number')
     _STRING     = QuotedString("'", escQuote="''")    ('string')
 
     _TILDE      = Literal('~')                        ('tilde')
@@ -1242,12 +1537,18 @@ class MatlabParser:
     # version of _id that we use in most grammar expressions below to avoid
     # writing "Group(_id)('name')".
 
-    _reserved   = _BREAK | _CASE | _CATCH | _CLASSDEF | _CONTINUE \
-                  | _ELSE | _ELSEIF | _END | _FOR | _FUNCTION \
-                  | _GLOBAL | _IF | _OTHERWISE | _PARFOR | _PERSISTENT \
-                  | _RETURN | _SPMD | _SWITCH | _TRY | _WHILE
+    # _reserved matches any keyword the same way that Keyword objects do,
+    # i.e., not when it is part of a longer identifier.
 
-    _identifier = Word(alphas, alphanums + '_')
+    _keywords   = [k.match for k in (_BREAK, _CASE, _CATCH, _CLASSDEF,
+                                     _CONTINUE, _ELSE, _ELSEIF, _END, _FOR,
+                                     _FUNCTION, _GLOBAL, _IF, _OTHERWISE,
+                                     _PARFOR, _PERSISTENT, _RETURN, _SPMD,
+                                     _SWITCH, _TRY, _WHILE)]
+    _reserved   = Regex(r'(?<![A-Za-z0-9_$])(?:{0})(?![A-Za-z0-9_$])'
+                        .format('|'.join(_keywords)))
+
+    _identifier = Regex(r'[A-Za-z][A-Za-z0-9_]*')
     _id         = NotAny(_reserved) + _identifier('identifier')
     _name       = Group(_id)('name')
 
@@ -1373,10 +1674,28 @@ class MatlabParser:
     _row_sep       = Optional(_WHITE) + _SEMI + Optional(_WHITE) + Optional(_comment) \
                      | Optional(_WHITE) + _comment | _EOL
     _one_row       = _comma_subs('subscript list') ^ _space_subs('subscript list')
-    _rows          = Optional(_WHITE) + Optional(Group(_one_row.leaveWhitespace())) \
+    _rows          = Optional(_WHITE) + Optional(Group(leave_whitespace(_one_row))) \
                      + ZeroOrMore(_row_sep + Optional(Group(_one_row))) + Optional(_WHITE)
     _bare_array    = Group(_LBRACKET + _rows('row list') + _RBRACKET)('array')
 
+    # Arrays containing only numbers, possibly signed, are common in models
+    # and can be very large (e.g., initial conditions), so they are matched
+    # by a single regular expression ahead of _bare_array and turned straight
+    # into NumericArray objects.  As in _one_row, elements are separated
+    # either by commas or by whitespace, but not both in one row, and a sign
+    # must be attached to its number ("[1 - 2]" is a formula).  Anything else,
+    # and arrays whose rows differ in length, are left to _bare_array.
+
+    _num_elem      = r'[-+]?(?:{0})'.format(_number_re)
+    _num_row       = (r'(?:{0}(?:[ \t]*,[ \t]*{0})+|{0}(?:[ \t]+{0})*)'
+                      .format(_num_elem))
+    _num_row_sep   = r'(?:[ \t]*[;\n])+[ \t]*'
+    _numeric_array_re = (r'\[(?:[ \t]*[;\n])*[ \t]*{0}(?:{1}{0})*'
+                         r'(?:[ \t]*[;\n])*[ \t]*\]'
+                         .format(_num_row, _num_row_sep))
+    _NUMERIC_ARRAY = Regex(_numeric_array_re)('numeric array') \
+                     .setParseAction(_text_to_numeric_array)
+
     ParserElement.setDefaultWhitespaceChars(' \t\n\r')
 
     # Cell arrays.  You can write {} by itself, but a reference has to have at
@@ -1522,11 +1841,9 @@ class MatlabParser:
 
     ParserElement.setDefaultWhitespaceChars(' \t')
 
-    _most_ops          = Group(_PLUS ^ _MINUS ^ _TIMES ^ _ELTIMES ^ _MRDIVIDE
-                               ^ _MLDIVIDE ^ _RDIVIDE ^ _LDIVIDE ^ _MPOWER
-                               ^ _ELPOWER ^ _LT ^ _LE ^ _GT ^ _GE ^ _EQ ^ _NE
-                               ^ _AND ^ _OR ^ _SHORT_AND ^ _SHORT_OR ^ _COLON
-                               ^ _NC_TRANSP)
+    # _most_ops is any of the binary operators, colon or ".'".
+
+    _most_ops          = Group(Regex(r"\.[*/\\^']|[<>~=]=|&&|\|\||[-+*/\\^<>&|:]"))
     _noncmd_arg_start  = _EQUALS | _LPAR | _most_ops + _WHITE | _delimiter | _comment
     _dash_term         = Combine(Literal('-') + Word(alphas, alphanums + '_'))
     _fun_cmd_arg       = _STRING | _dash_term | CharsNotIn(" ,;\t\n\r")
@@ -1565,19 +1882,26 @@ class MatlabParser:
                      | _struct_access  \
                      | _array_access   \
                      | _cell_array     \
+                     | _NUMERIC_ARRAY  \
                      | _bare_array     \
                      | _fun_handle     \
                      | _ambiguous_id   \
                      | _NUMBER         \
                      | _STRING)
 
+    # The operator groups are regular expressions equivalent to combining
+    # the individual operators defined above with "^"; e.g., _timesdiv is
+    # _TIMES ^ _ELTIMES ^ _MRDIVIDE ^ _MLDIVIDE ^ _RDIVIDE ^ _LDIVIDE.
+
+    ParserElement.setDefaultWhitespaceChars(' \t')
     _transp_op     = NotAny(_WHITE) + _NC_TRANSP ^ NotAny(_WHITE) + _CC_TRANSP
-    _uplusminusneg = _UPLUS ^ _UMINUS ^ _UNOT
-    _plusminus     = _PLUS ^ _MINUS
-    _timesdiv      = _TIMES ^ _ELTIMES ^ _MRDIVIDE ^ _MLDIVIDE ^ _RDIVIDE ^ _LDIVIDE
-    _power         = _MPOWER ^ _ELPOWER
-    _logical_op    = _LE ^ _GE ^ _NE ^ _LT ^ _GT ^ _EQ
+    _uplusminusneg = Regex(r'[-+~]')                   ('unary operator')
+    _plusminus     = Regex(r'[-+]')                    ('binary operator')
+    _timesdiv      = Regex(r'\.?[*/\\]')               ('binary operator')
+    _power         = Regex(r'\.?\^')                   ('binary operator')
+    _logical_op    = Regex(r'[<>~=]=|[<>]')            ('binary operator')
     _colon_op      = _COLON('colon operator')
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
 
     # In MATLAB, power and transpose have higher precedence than the unary
     # operators.  The next hack solves a problem in correctly matching
@@ -1610,7 +1934,13 @@ class MatlabParser:
                            ^ FollowedBy(_not_unary) + _UMINUS \
                            ^ FollowedBy(_not_unary) + _UNOT
 
-    _expr        <<= infixNotation(_operand, [
+    # InfixExpression (in grammar_utils.py) takes the same operator table as
+    # infixNotation() and produces the same results, but it parses by
+    # precedence climbing instead of descending through one nested
+    # expression per precedence level, which is much faster on long
+    # formulas such as rate laws.
+
+    _expr        <<= InfixExpression(_operand, [
         (Group(_transp_op),                    1, opAssoc.LEFT, makeLRlike(1)),
         (Group(_uplusminusneg_after),          1, opAssoc.RIGHT),
         (Group(_power),                        2, opAssoc.LEFT, makeLRlike(2)),
@@ -1661,32 +1991,33 @@ class MatlabParser:
     # when used inside arrays.  Along with this, the definitions of arrays
     # and their subscripts earlier in this file also have explicit uses of
     # _WHITE in them, which wouldn't be necessary except for the fact that
-    # _operand_in_array below uses leaveWhitespace() to cause whitespace to
-    # be significant.
+    # _operand_in_array below uses leave_whitespace() (see grammar_utils.py)
+    # to cause whitespace to be significant.
     #
     # Look, I know it's ugly.
 
-    _plusminus_array = (OneOrMore(_WHITE) + (_PLUS ^ _MINUS).leaveWhitespace() + OneOrMore(_WHITE)) \
-                       | (NotAny(_WHITE) + (_PLUS ^ _MINUS).leaveWhitespace())
+    _plusminus_array = (OneOrMore(_WHITE) + leave_whitespace(_PLUS ^ _MINUS) + OneOrMore(_WHITE)) \
+                       | (NotAny(_WHITE) + leave_whitespace(_PLUS ^ _MINUS))
 
     _funcall_or_array_in_array = Group(_fun_access('name')
-                                       + _LPAR.copy().leaveWhitespace() + _opt_arglist + _RPAR
+                                       + leave_whitespace(_LPAR.copy()) + _opt_arglist + _RPAR
                                       ).setResultsName('array or function')  # noqa
 
-    _operand_in_array = Group(_end_op
-                              | _TILDE
-                              | _funcall_or_array_in_array
-                              | _struct_access
-                              | _array_access
-                              | _cell_array
-                              | _bare_array
-                              | _fun_handle
-                              | _ambiguous_id
-                              | _NUMBER
-                              | _STRING
-                             ).leaveWhitespace()
-
-    _expr_in_array <<= infixNotation(_operand_in_array, [
+    _operand_in_array = leave_whitespace(Group(_end_op
+                                               | _TILDE
+                                               | _funcall_or_array_in_array
+                                               | _struct_access
+                                               | _array_access
+                                               | _cell_array
+                                               | _NUMERIC_ARRAY
+                                               | _bare_array
+                                               | _fun_handle
+                                               | _ambiguous_id
+                                               | _NUMBER
+                                               | _STRING
+                                              ))
+
+    _expr_in_array <<= InfixExpression(_operand_in_array, [
         (Group(_transp_op),                    1, opAssoc.LEFT, makeLRlike(1)),
         (Group(_uplusminusneg_after),          1, opAssoc.RIGHT),
         (Group(_power),                        2, opAssoc.LEFT, makeLRlike(2)),
@@ -1786,7 +2117,7 @@ class MatlabParser:
 
     _scope_type     = Group(_PERSISTENT | _GLOBAL)         ('type')
     ParserElement.setDefaultWhitespaceChars(' \t')
-    _scope_var_list = Group(_id) + ZeroOrMore(_WHITE + Group(_id)).leaveWhitespace()
+    _scope_var_list = Group(_id) + leave_whitespace(ZeroOrMore(_WHITE + Group(_id)))
     _scope_args     = _scope_var_list                      ('variables list')
     ParserElement.setDefaultWhitespaceChars(' \t\n\r')
     _scope_stmt     = Group(_scope_type + _scope_args)     ('scope declaration')
@@ -1810,7 +2141,26 @@ class MatlabParser:
                             | _assignment
                             | _funcall_cmd_style
                             | _standalone_expr)
-    _stmt_list    <<= ZeroOrMore(_stmt ^ _shell_cmd ^ _noncontent)
+
+    # Statement-level alternatives are combined using PredictiveOr (see
+    # grammar_utils.py), which behaves like "^" but only tries alternatives
+    # that can begin with the next character in the input.  The following
+    # are the characters each kind of statement can start with; '\n' means
+    # the alternative can match an end of line.  If you change the grammar
+    # for any of these constructs, make sure these sets remain supersets of
+    # what is possible, or the parser will silently miss matches.  Each
+    # statement is converted to MatlabNode objects as soon as it is matched,
+    # by the parse action _statements_to_nodes().
+
+    _stmt_start     = alphanums + ".'([{@-+~"
+    _shell_start    = '!'
+    _nonc_start     = ',;%\n'
+    _fun_start      = 'f'
+
+    _stmt_list    <<= ZeroOrMore(PredictiveOr([(_stmt, _stmt_start),
+                                               (_shell_cmd, _shell_start),
+                                               (_noncontent, _nonc_start)])
+                                 .setParseAction(_statements_to_nodes))
 
     # Function definitions.
     #
@@ -1860,7 +2210,11 @@ class MatlabParser:
     # And now, the function body for function definitions that permit nesting.
     # (Bodies that don't allow function nesting simply use _stmt_list.)
 
-    _fun_body <<= ZeroOrMore(_fun_def_deep ^ _stmt ^ _shell_cmd ^ _noncontent)
+    _fun_body <<= ZeroOrMore(PredictiveOr([(_fun_def_deep, _fun_start),
+                                           (_stmt, _stmt_start),
+                                           (_shell_cmd, _shell_start),
+                                           (_noncontent, _nonc_start)])
+                             .setParseAction(_statements_to_nodes))
 
     # The complete MATLAB file syntax.
     #
@@ -1873,13 +2227,34 @@ class MatlabParser:
     #
     # However, using that grammar definition, the resulting MOCCASIN parser
     # takes almost twice as long to parse anything as it would if only one of
-    # those versions was present.  Since MOCCASIN already assumes that input
-    # files are valid MATLAB, we relax the definition to the following form
-    # to gain a substantial speedup.  This is not strictly correct because it
-    # allows mixing the forms.  (MOCCASIN passes all our syntactic tests
-    # either way, but probably would fail to reject some invalid inputs.)
-
-    _matlab = ZeroOrMore(_fun_def_shallow ^ _fun_def_deep ^ _stmt ^ _shell_cmd ^ _noncontent)
+    # those versions was present.  So instead, we define the two forms
+    # separately, and before parsing a file, we decide which one to use by
+    # scanning the text with function_style() (in grammar_utils.py).  That
+    # scan is far cheaper than trying both grammars.  If the scan can't
+    # decide, we fall back to _matlab, which is relaxed: it is not strictly
+    # correct because it allows mixing the forms, but it accepts any valid
+    # input either way.  Files the scan thinks are mixed get _matlab_deep, so
+    # that they are rejected.  As with _stmt_list, the alternatives are
+    # combined with PredictiveOr.
+
+    _matlab_shallow = ZeroOrMore(PredictiveOr([(_fun_def_shallow, _fun_start),
+                                               (_stmt, _stmt_start),
+                                               (_shell_cmd, _shell_start),
+                                               (_noncontent, _nonc_start)])
+                                 .setParseAction(_statements_to_nodes))
+
+    _matlab_deep    = ZeroOrMore(PredictiveOr([(_fun_def_deep, _fun_start),
+                                               (_stmt, _stmt_start),
+                                               (_shell_cmd, _shell_start),
+                                               (_noncontent, _nonc_start)])
+                                 .setParseAction(_statements_to_nodes))
+
+    _matlab         = ZeroOrMore(PredictiveOr([(_fun_def_shallow, _fun_start),
+                                               (_fun_def_deep, _fun_start),
+                                               (_stmt, _stmt_start),
+                                               (_shell_cmd, _shell_start),
+                                               (_noncontent, _nonc_start)])
+                                 .setParseAction(_statements_to_nodes))
 
 
     # Preprocessor.
@@ -1911,28 +2286,14 @@ class MatlabParser:
     # MATLAB does this because the ellipsis sequence is turned into a space;
     # which is not the same as ignoring it completely.
     #
-    # Currently, MOCCASIN does not handle continuations well: it always
-    # replaces them, even inside strings and shell commands, because in our
-    # application we don't do anything with strings and shell commands
-    # anyway.  We can afford to munge them.  We use this cheap approach
-    # because it's difficult to avoid matching inside strings and shell
-    # commands.  A better approach would be something like the following: (1)
-    # preprocess the input to store all strings and shell commands and
-    # replace them in the input with temporary markers, (2) do the
-    # continuation replacements, (3) go back and replace the markers with the
-    # stored strings and shell commands.
-
-    _continuation  = Combine(_ELLIPSIS.leaveWhitespace()
-                             + Optional(CharsNotIn('\n\r\f')('comment'))
-                             + _EOL + _SOL)
-
-    _continuation.setParseAction(lambda t: ' ')
+    # The replacement is done by preprocess() (in grammar_utils.py), in a
+    # single scan of the text that skips strings, comments and shell
+    # commands, so that "..." is left intact in them.  It also returns a map
+    # from positions in the preprocessed text back to the original input,
+    # which we use to report parsing errors at the right place.
 
     def _preprocess(self, input):
-        # Remove DOS-style carriage returns from the input.
-        input = input.replace('\r\n', '\n')
-        # Remove continuations.
-        return self._continuation.transformString(input)
+        return preprocess(input)
 
 
     # Generator for final MatlabNode-based output representation.
@@ -1941,13 +2302,16 @@ class MatlabParser:
     # and creates our format consisting of MatlabContext and MatlabNode.
     # .........................................................................
 
-    def _generate_nodes_and_contexts(self, pr):
+    def _generate_nodes_and_contexts(self, pr, deferred=()):
         # Start by creating a context for the overall input.
         self._push_context(MatlabContext(topmost=True))
 
-        # 1st pass: visit ParseResults items, translate them to MatlabNodes,
-        # and create contexts for function definitions encountered.
-        nodes = [ParseResultsTransformer(self).visit(item) for item in pr]
+        # The parse actions have already translated the statements to
+        # MatlabNodes.  Create contexts for function definitions.
+        nodes = self._normalize(list(pr))
+        self._attach_contexts(nodes)
+        for node, load in deferred:
+            self._context.functions.defer(node.name, node.context, load)
 
         # 2nd & 3rd passes: infer the types of objects where possible, and
         # transform some classes into others to overcome limitations in our
@@ -1963,9 +2327,24 @@ class MatlabParser:
             self._context.name = function_name
 
         self._context.nodes = nodes
+        if self._recover:
+            self._context.errors = self._unparsed_nodes(nodes)
         return self._context
 
 
+    def _unparsed_nodes(self, nodes):
+        # Unparsed nodes only stand in for whole chunks, so like function
+        # definitions, they only appear at the top level or directly in the
+        # bodies of functions.
+        found = []
+        for node in nodes:
+            if isinstance(node, Unparsed):
+                found.append(node)
+            elif isinstance(node, FunDef):
+                found.extend(self._unparsed_nodes(node.body or []))
+        return found
+
+
     # Context and scope management.
     #
     # This block is used by the code that converts the PyParsing output to
@@ -2005,6 +2384,30 @@ class MatlabParser:
             self._context = self._context.parent
 
 
+    def _normalize(self, nodes):
+        # Applies the optional rewritings of the nodes (see share_leaves and
+        # flatten in __init__()).  Done before contexts are attached, so
+        # that the contexts refer to the rewritten nodes too.
+        if self._flatten:
+            nodes = OperatorFlattener().visit(nodes)
+        if self._sharer is not None:
+            nodes = self._sharer.visit(nodes)
+        return nodes
+
+
+    def _attach_contexts(self, nodes):
+        # MATLAB functions establish contexts for other constructs, and we
+        # build a dynamic stack to track them.  Function definitions can
+        # only appear at the top level or directly in the bodies of other
+        # functions, so only those lists need to be looked at.
+        for node in nodes:
+            if isinstance(node, FunDef):
+                node.context = self._save_function_definition(node)
+                self._push_context(node.context)
+                self._attach_contexts(node.body or [])
+                self._pop_context()
+
+
     def _save_function_definition(self, node):
         newcontext = MatlabContext(name=node.name, parent=self._context,
                                    parameters=node.parameters,
@@ -2015,7 +2418,11 @@ class MatlabParser:
 
     def _save_function_call(self, node):
         # Save each call as a list of the arguments to the call.
-        # This will thus be a list of lists.
+        # This will thus be a list of lists.  When streaming (see
+        # iter_parse()), calls are not saved, since the arguments of every
+        # call in the file would then stay in memory.
+        if self._streaming:
+            return
         if node.name not in self._context.calls:
             self._context.calls[node.name] = [node.args]
         else:
@@ -2023,7 +2430,16 @@ class MatlabParser:
 
 
     def _save_assignment(self, node):
-        self._context.assignments[node.lhs] = node.rhs
+        # When streaming (see iter_parse()), only the values that
+        # _get_assignment() is asked about are kept: those of plain names
+        # assigned handles, anonymous functions or other names.  Keeping the
+        # rest would hold every right-hand side in the file in memory.
+        if self._streaming and not (isinstance(node.lhs, Identifier)
+                                    and isinstance(node.rhs, (Handle, AnonFun,
+                                                              Identifier))):
+            self._context.assignments.pop(node.lhs, None)
+        else:
+            self._context.assignments[node.lhs] = node.rhs
 
 
     def _get_assignment(self, node, context, recursive=False):
@@ -2065,7 +2481,7 @@ class MatlabParser:
         if context.calls and name in context.calls:
             calls += context.calls[name]
         if anywhere and context.functions:
-            for fun_name, fun_context in context.functions.items():
+            for fun_name, fun_context in context.functions.loaded_items():
                 if name == fun_name:
                     continue
                 calls += self._get_direct_calls(name, fun_context, False, False)
@@ -2084,7 +2500,7 @@ class MatlabParser:
                     if isinstance(arg, FuncHandle) and name == arg.name:
                         calls[fun_name].append(arglist)
         if anywhere and context.functions:
-            for fun_name, fun_context in context.functions.items():
+            for fun_name, fun_context in context.functions.loaded_items():
                 calls.update(self._get_indirect_calls(name, fun_context, False, False))
         if recursive and hasattr(context, 'parent') and context.parent:
             calls.update(self._get_indirect_calls(name, context.parent, anywhere, True))
@@ -2105,12 +2521,399 @@ class MatlabParser:
     # The core parser invocation.
     # .........................................................................
 
+    def _grammar_for(self, input):
+        return self._grammar_for_style(function_style(input))
+
+
+    def _grammar_for_style(self, style):
+        # Scripts without function definitions can use either variant; the
+        # shallow one doesn't have to consider nested definitions.
+        if style == 'deep' or style == 'mixed':
+            return self._matlab_deep
+        elif style == 'shallow' or style is None:
+            return self._matlab_shallow
+        else:
+            return self._matlab
+
+
     def _do_parse(self, input):
-        preprocessed = self._preprocess(input)
-        pr = self._matlab.parseString(preprocessed, parseAll=True)
+        try:
+            return self._parse_input(input)
+        except ParseBaseException:
+            if not self._recover:
+                raise
+            # Parse it in pieces, leaving Unparsed nodes for the bad ones.
+            self._reset()
+            return self._parse_pieces(input)
+
+
+    def _parse_input(self, input):
+        if self._lazy:
+            parsed = self._lazy_parse(input)
+            if parsed is not None:
+                return self._generate_nodes_and_contexts(*parsed)
+        if (self._workers > 1 and self._profile is None and self._trace is None
+                and self._budget is None):
+            nodes = self._parallel_parse(input)
+            if nodes is not None:
+                return self._generate_nodes_and_contexts(nodes)
+        if self._memo is not None or self._fast_path is not None:
+            try:
+                return self._parse_pieces(input)
+            except MatlabParsingBudgetException:
+                raise
+            except MatlabParsingException:
+                # Parse it again below, to report the error the usual way.
+                self._reset()
+        preprocessed, offsets = self._preprocess(input)
+        grammar = self._grammar_for(preprocessed)
+        pr = self._run_grammar(grammar, preprocessed, offsets, input)
         return self._generate_nodes_and_contexts(pr)
 
 
+    def _recording(self, recorder):
+        # Profiles and traces are only active while the grammar is running.
+        if recorder is None:
+            return no_recording()
+        return recorder.recording(self._to_name)
+
+
+    def _metering(self):
+        # Likewise for the budget meter, which is replaced by _reset().
+        if self._meter is None:
+            return no_recording()
+        return self._meter.running()
+
+
+    def _run_grammar(self, grammar, preprocessed, offsets, input, first_line=1):
+        # Packrat memoization is a necessary optimization; without it, the
+        # grammar above practically never finishes parsing anything.  The
+        # memo table is process-global in PyParsing, so we configure it for
+        # every parse and empty it afterwards to release the memory.
+        set_packrat_policy(self._packrat)
+        try:
+            with self._recording(self._profile), self._recording(self._trace), \
+                 self._metering():
+                return grammar.parseString(preprocessed, parseAll=True)
+        except ParseBaseException as err:
+            # Make the error refer to the input as the user wrote it.
+            err.loc = offsets.original(err.loc)
+            err.pstr = input
+            raise
+        except BudgetExceeded as err:
+            loc = offsets.original(min(err.loc, len(preprocessed)))
+            line = first_line + lineno(loc, input) - 1
+            raise MatlabParsingBudgetException(err.reason, loc, line,
+                                               col(loc, input))
+        finally:
+            self.packrat_stats = packrat_stats(self._packrat)
+            ParserElement.resetCache()
+
+
+    def _parallel_parse(self, input):
+        # Files with several function definitions are split into chunks
+        # at the function boundaries (see top_level_chunks() in
+        # grammar_utils.py), which are parsed by a pool of processes.  The
+        # resulting nodes are put back in order and go through the same
+        # context and type inference steps as the output of a serial parse,
+        # so the results are the same.  Returns None if the input is not
+        # worth splitting or the results can't be sent back by the workers,
+        # in which case the caller parses it serially.
+        style = function_style(input)
+        if style is None or style == 'unknown':
+            return None
+        chunks = [chunk for chunk, _ in top_level_chunks(io.StringIO(input), style)]
+        if len(chunks) < 2:
+            return None
+        # Imported here because most runs don't need it, and importing it
+        # adds noticeably to the start-up time of the command-line tool.
+        import multiprocessing.pool
+        tasks = [(chunk, style, self._packrat) for chunk in chunks]
+        pool = multiprocessing.Pool(min(self._workers, len(chunks)))
+        try:
+            results = pool.map(_parse_chunk, tasks)
+        except multiprocessing.pool.MaybeEncodingError:
+            return None
+        finally:
+            pool.close()
+            pool.join()
+        nodes = []
+        start = 0
+        for chunk, (chunk_nodes, _, error) in zip(chunks, results):
+            if error:
+                loc, msg = error
+                raise ParseException(input, start + loc, msg)
+            nodes.extend(chunk_nodes)
+            start += len(chunk)
+        stats = [chunk_stats for _, chunk_stats, _ in results]
+        self.packrat_stats = PackratStats(policy=self._packrat,
+                                          entries=sum(s.entries for s in stats),
+                                          hits=sum(s.hits for s in stats),
+                                          misses=sum(s.misses for s in stats),
+                                          peak=max(s.peak for s in stats))
+        return nodes
+
+
+    def _lazy_parse(self, input):
+        # Only the headers of top-level function definitions are parsed
+        # here; the rest of each definition is kept as text and parsed by
+        # _load_function() when its context is looked up in the functions
+        # dictionary (see FunctionDict in context.py).  Everything else is
+        # parsed normally.  Returns the nodes and a list of pairs of FunDef
+        # node and loader, or None if the input has no functions to defer.
+        style = function_style(input)
+        if style is None or style == 'unknown':
+            return None
+        grammar = self._grammar_for_style(style)
+        nodes = []
+        deferred = []
+        start = 0
+        for chunk, first_line in top_level_chunks(io.StringIO(input), style):
+            header = None
+            if not inline_function(chunk):
+                header = self._parse_header(grammar, chunk, style, first_line)
+            if header:
+                load = functools.partial(self._load_function, grammar, header,
+                                         chunk, first_line)
+                nodes.append(header)
+                deferred.append((header, load))
+            else:
+                preprocessed, offsets = self._preprocess(chunk)
+                try:
+                    pr = self._run_grammar(grammar, preprocessed, offsets, chunk,
+                                           first_line)
+                except ParseBaseException as err:
+                    raise ParseException(input, start + err.loc, err.msg)
+                nodes.extend(pr)
+            start += len(chunk)
+        if not deferred:
+            return None
+        return nodes, deferred
+
+
+    def _parse_header(self, grammar, chunk, style, first_line=1):
+        # Returns a FunDef with an empty body for the first line of `chunk`
+        # (including continuation lines), or None if that isn't possible.
+        if not chunk.lstrip().startswith('function'):
+            return None
+        scanner = StatementScanner()
+        header = ''
+        for line in io.StringIO(chunk):
+            header += line
+            scanner.feed(line)
+            if not (scanner.continued or scanner.in_comment):
+                break
+        if not header.endswith('\n'):
+            header += '\n'
+        if style == 'deep' or style == 'mixed':
+            header += 'end\n'
+        preprocessed, offsets = self._preprocess(header)
+        try:
+            nodes = list(self._run_grammar(grammar, preprocessed, offsets, header,
+                                           first_line))
+        except ParseBaseException:
+            return None
+        if len(nodes) != 1 or not isinstance(nodes[0], FunDef):
+            return None
+        return nodes[0]
+
+
+    def _load_function(self, grammar, node, chunk, first_line):
+        # Parses a deferred function definition and completes its FunDef
+        # node and context in place, doing what _generate_nodes_and_contexts()
+        # would have done for them.
+        preprocessed, offsets = self._preprocess(chunk)
+        meter = self._meter
+        if meter is not None:
+            self._meter = self._budget.meter()
+        try:
+            loaded = list(self._run_grammar(grammar, preprocessed, offsets, chunk,
+                                            first_line))
+        except ParseBaseException as err:
+            msg = 'Failed to parse function {0} at line {1}: {2}'
+            line = first_line + err.lineno - 1
+            raise MatlabParsingException(msg.format(node.name.name, line, err.msg))
+        finally:
+            self._meter = meter
+        if (not loaded or not isinstance(loaded[0], FunDef)
+                or any(isinstance(other, FunDef) for other in loaded[1:])):
+            msg = 'Failed to parse function {0} at line {1}'
+            raise MatlabParsingException(msg.format(node.name.name, first_line))
+        node.body = self._normalize(loaded[0].body)
+        context = node.context
+        current = self._context
+        self._context = context
+        self._attach_contexts(node.body)
+        self._context = context.parent
+        NodeTransformer(self).visit(node)
+        NodeTransformer(self).visit(node)
+        # Anything after the function's 'end' on the same line (usually a
+        # comment) belongs to the enclosing context, right after the node.
+        rest = loaded[1:]
+        if rest:
+            rest = NodeTransformer(self).visit(rest)
+            rest = NodeTransformer(self).visit(rest)
+            nodes = context.parent.nodes
+            index = next(i for i, other in enumerate(nodes) if other is node)
+            nodes[index + 1:index + 1] = rest
+        self._context = current
+
+
+    def _chunk_nodes(self, grammar, chunk, first_line):
+        # Returns the list of nodes for one chunk from top_level_chunks().
+        # In error recovery mode, a chunk that fails to parse becomes an
+        # Unparsed node; function definitions taken apart by _reparse_chunk()
+        # thereby lose only the bad statements of their bodies.
+        # If there is a statement memo, the nodes may come from (and are
+        # stored in) it, so callers must not modify them.  Statements simple
+        # enough for the fast path (see FastPath above) don't get that far.
+        if self._fast_path is not None:
+            nodes = self._fast_path.parse(chunk)
+            if nodes is not None:
+                return nodes
+        if self._memo is not None:
+            key = (grammar.name, statement_key(chunk))
+            nodes = self._memo.get(key)
+            if nodes is not None:
+                return nodes
+        preprocessed, offsets = self._preprocess(chunk)
+        try:
+            nodes = list(self._run_grammar(grammar, preprocessed, offsets, chunk,
+                                           first_line))
+        except ParseBaseException as err:
+            line = first_line + err.lineno - 1
+            if self._recover:
+                msg = '{0} (at line {1}, column {2})'
+                last_line = first_line + chunk.count('\n', 0, len(chunk) - 1)
+                return [Unparsed(text=chunk, first_line=first_line,
+                                 last_line=last_line,
+                                 message=msg.format(err.msg, line, err.col))]
+            msg = 'Failed to parse MATLAB input at line {0}: {1}'
+            raise MatlabParsingException(msg.format(line, err.msg))
+        if self._memo is not None:
+            self._memo.put(key, nodes)
+        return nodes
+
+
+    def _parse_pieces(self, input, context=None):
+        # Does the work of reparse(): the input is parsed one top-level
+        # chunk (see top_level_chunks() in grammar_utils.py) at a time, and
+        # function definitions one statement at a time, reusing the pieces
+        # of the input of `context` where the text is the same.
+        style = function_style(input)
+        previous = {}
+        if context is not None and context.chunks:
+            previous_style, previous = context.chunks
+            if previous_style != style:
+                previous = {}
+        grammar = self._grammar_for_style(style)
+        chunks = {}
+        nodes = []
+        for chunk, first_line in top_level_chunks(io.StringIO(input), style):
+            if chunk not in chunks:
+                if chunk in previous:
+                    chunks[chunk] = previous[chunk]
+                else:
+                    chunks[chunk] = self._reparse_chunk(grammar, style, chunk,
+                                                        first_line, previous,
+                                                        chunks)
+            # The passes below modify the nodes, so they get copies.
+            nodes.extend(copy.deepcopy(chunks[chunk]))
+        top_context = self._generate_nodes_and_contexts(nodes)
+        top_context.chunks = (style, chunks)
+        return top_context
+
+
+    def _reparse_chunk(self, grammar, style, chunk, first_line, previous, chunks):
+        # Function definitions are taken apart so that editing one line of a
+        # long function only means parsing the statement on that line again:
+        # the header (with an 'end' added, for the grammar), and the body as
+        # a series of chunks of its own, each looked up in `previous` and
+        # recorded in `chunks` like the top-level ones.  Definitions that
+        # don't have the plain form assumed here are parsed in one piece.
+        lines = chunk.splitlines(True)
+        if (style not in ['deep', 'shallow'] or inline_function(chunk)
+                or not lines[0].lstrip().startswith('function')
+                or (style == 'deep' and lines[-1].strip() not in ['end', 'end;'])):
+            return self._chunk_nodes(grammar, chunk, first_line)
+        scanner = StatementScanner()
+        count = 0
+        for line in lines:
+            count += 1
+            scanner.feed(line)
+            if not (scanner.continued or scanner.in_comment):
+                break
+        header = ''.join(lines[:count])
+        if not header.endswith('\n'):
+            header += '\n'
+        body = lines[count:-1] if style == 'deep' else lines[count:]
+        if style == 'deep':
+            header += 'end\n'
+        if header not in chunks:
+            chunks[header] = (previous[header] if header in previous
+                              else self._chunk_nodes(grammar, header, first_line))
+        if len(chunks[header]) != 1 or not isinstance(chunks[header][0], FunDef):
+            return self._chunk_nodes(grammar, chunk, first_line)
+        node = copy.copy(chunks[header][0])
+        node.body = list(node.body or [])
+        body_start = first_line + count
+        for piece, line in top_level_chunks(iter(body), style):
+            if piece not in chunks:
+                chunks[piece] = (previous[piece] if piece in previous
+                                 else self._chunk_nodes(grammar, piece,
+                                                        body_start + line - 1))
+            node.body.extend(chunks[piece])
+        return [node]
+
+
+    def _iter_chunks(self, path, style, top_context):
+        # Each chunk is a self-contained piece of the file (see
+        # top_level_chunks() in grammar_utils.py), so it can be parsed with
+        # the grammar for the whole file and then dropped.  Type inference
+        # is done the same way as in _generate_nodes_and_contexts(), except
+        # that it only knows about the chunks seen so far.
+        grammar = self._grammar_for_style(style)
+        with codecs.open(path) as file:
+            for chunk, first_line in top_level_chunks(file, style):
+                nodes = self._chunk_nodes(grammar, chunk, first_line)
+                if self._memo is not None:
+                    nodes = copy.deepcopy(nodes)
+                if self._share:
+                    # Leaves are shared within a chunk only, or the sharer
+                    # would end up holding every distinct leaf in the file.
+                    self._sharer = LeafSharer()
+                self._context = top_context
+                nodes = self._normalize(nodes)
+                self._attach_contexts(nodes)
+                nodes = NodeTransformer(self).visit(nodes)
+                nodes = NodeTransformer(self).visit(nodes)
+                for node in nodes:
+                    yield node
+
+
+    def _cached_parse(self, input, use_cache=True):
+        # Consult the persistent parse cache (if the user gave us one) before
+        # doing the real work.  The context is stored before any caller
+        # modifies it (e.g., parse_file() setting the file name).
+        if self._cache is None or not use_cache or self._lazy:
+            return self._do_parse(input)
+        # The optional rewritings of the nodes change the results, so they
+        # are part of the key.  (Without them, the key is as it always was.)
+        options = [name for name, wanted in [('flatten', self._flatten),
+                                             ('share_leaves', self._share)]
+                   if wanted]
+        key = self._cache.key(input, *options)
+        top_context = self._cache.get(key)
+        if top_context is None:
+            top_context = self._do_parse(input)
+            # A parser that isn't recovering from errors mustn't get this.
+            if not top_context.errors:
+                self._cache.put(key, top_context)
+        else:
+            self._context = top_context
+        return top_context
+
+
     # Debugging.
     # .........................................................................
 
@@ -2118,11 +2921,11 @@ class MatlabParser:
     # debugging output, it uses the name rather than a generic regexp term.
 
     _to_name = [ _AND, _CC_TRANSP, _COLON, _COMMA, _DOT, _ELLIPSIS, _ELPOWER,
-                 _ELTIMES, _END, _EOL, _EQ, _EQUALS, _EXPONENT, _FLOAT,
-                 _FUNCTION, _GE, _GT, _INTEGER, _LBRACE, _LBRACKET, _LDIVIDE,
+                 _ELTIMES, _END, _EOL, _EQ, _EQUALS, _FUNCTION, _GE, _GT,
+                 _LBRACE, _LBRACKET, _LDIVIDE,
                  _LE, _LPAR, _LT, _MINUS, _MLDIVIDE, _MPOWER, _MRDIVIDE,
-                 _NC_TRANSP, _NE, _NUMBER, _OR, _PLUS, _RBRACE, _RBRACKET,
-                 _RDIVIDE, _RPAR, _SEMI, _SHORT_AND, _SHORT_OR, _SOL,
+                 _NC_TRANSP, _NE, _NUMBER, _NUMERIC_ARRAY, _OR, _PLUS, _RBRACE,
+                 _RBRACKET, _RDIVIDE, _RPAR, _SEMI, _SHORT_AND, _SHORT_OR, _SOL,
                  _STRING, _TILDE, _TIMES, _UMINUS, _UNOT, _UPLUS, _WHITE,
                  _ambiguous_id, _anon_handle, _array_access, _array_args,
                  _array_base, _assignment, _bare_array, _bare_cell,
@@ -2139,8 +2942,8 @@ class MatlabParser:
                  _fun_paramslist, _fun_with_end, _fun_without_end,
                  _funcall_cmd_style, _funcall_or_array, _id , _identifier,
                  _if_stmt, _lhs_array, _lhs_var, _line_c_start,
-                 _line_comment, _logical_op, _loop_var, _matlab,
-                 _most_ops, _multi_values, _name, _named_handle,
+                 _line_comment, _logical_op, _loop_var, _matlab, _matlab_deep,
+                 _matlab_shallow, _most_ops, _multi_values, _name, _named_handle,
                  _noncmd_arg_start, _noncontent, _not_unary, _one_param,
                  _one_row, _one_sub, _operand, _operand_in_array,
                  _opt_arglist, _opt_paramlist, _other_assign, _paramlist,
@@ -2154,23 +2957,17 @@ class MatlabParser:
                  _switch_stmt, _test_expr, _timesdiv, _transp_op, _try_stmt,
                  _uplusminusneg, _uplusminusneg_after, _while_stmt]
 
-    def _object_name(self, obj):
-        """Returns the name of a given object."""
-        try:
-            values = MatlabParser.__dict__.iteritems()  # Python 2
-        except:
-            values = MatlabParser.__dict__.items()      # Python 3
-        for name, thing in values:
-            if thing is obj:
-                return name
-
-
     _init_grammar_names_done = []
 
     def _init_grammar_names(self):
+        # The names come from one pass over the class dictionary, rather
+        # than a search of it for every object to be named.
         if 'done' not in self._init_grammar_names_done:
+            names = {}
+            for name, thing in six.iteritems(MatlabParser.__dict__):
+                names.setdefault(id(thing), name)
             for obj in self._to_name:
-                obj.setName(self._object_name(obj))
+                obj.setName(names.get(id(obj)))
             self._init_grammar_names_done.append('done')
 
 
@@ -2178,22 +2975,95 @@ class MatlabParser:
     # matches.  You can reduce the amount of output by changing the value
     # (which is _to_name by default) to a list of specific objects.  E.g.:
     #    _to_print_debug = [_cell_access, _cell_array, _bare_cell, _expr]
+    # The output is produced by a GrammarTrace that only lasts for one call
+    # to parse_string() or parse_file().
 
     _to_print_debug = _to_name # [_fun_body, _fun_def_deep, _fun_def_shallow, _stmt, _matlab]
 
+    @contextmanager
     def _print_debug(self, print_debug=False):
-        if print_debug:
-            for obj in self._to_print_debug:
-                obj.setDebug(True)
+        if not print_debug:
+            yield
+            return
+        saved = self._trace
+        rules = [obj.name for obj in self._to_print_debug]
+        self._trace = GrammarTrace(file=sys.stdout, rules=rules)
+        try:
+            yield
+        finally:
+            self._trace = saved
 
 
     # Instance initialization.
     # .........................................................................
 
-    def __init__(self):
+    def __init__(self, cache=None, packrat=True, workers=1, lazy=False,
+                 memo=None, fast_path=None, profile=None, trace=None,
+                 budget=None, recover=False, share_leaves=False, flatten=False):
+        """Creates a new parser.  If `cache` is given, it must be a ParseCache
+        object; parse results will then be looked up in and stored to it.
+        The value of `packrat` selects the packrat memoization policy used
+        for each parse: False (off), True (unbounded) or a positive integer N
+        (an LRU table of at most N entries).  Statistics about the last parse
+        are left in the attribute `packrat_stats`.  If `workers` is greater
+        than 1, inputs with several function definitions are split at the
+        function boundaries and the pieces parsed by that many processes.
+        If `lazy` is True, the bodies of top-level function definitions are
+        only parsed when their contexts are looked up in the `functions`
+        dictionary of the top-level context, and errors in them are raised
+        as MatlabParsingException at that point.  Types are then inferred
+        only from the parts of the file parsed so far.  This mode does not
+        use the cache.  If `memo` is given, it must be a StatementMemo object,
+        which may be shared with other parsers; inputs are then parsed a
+        statement at a time, and statements found in the memo are not
+        parsed again.  If `fast_path` is True or a FastPath object (which
+        may also be shared), inputs are likewise parsed a statement at a
+        time, and simple assignments are recognized without the grammar;
+        the FastPath object counts the statements that were and were not.
+        If `profile` is given, it must be a GrammarProfile object (see
+        grammar_utils.py); the named grammar elements are then profiled
+        whenever the grammar is run, and the counts accumulate in it.  Files
+        are not split among processes in that case.  Likewise, if `trace` is
+        given, it must be a GrammarTrace object, which then records the
+        matches tried by the grammar.  If `budget` is given, it must be a
+        ParseBudget object; if the grammar exceeds it on an input, parsing
+        stops with a MatlabParsingBudgetException, even when fail_soft is
+        True.  The budget applies to each call of parse_string() and
+        parse_file(), and separately to each function loaded in lazy mode.
+        Files are not split among processes in that case either.
+
+        If `recover` is True, an input that fails to parse is parsed again
+        a top-level statement or function definition at a time, and then
+        function bodies a statement at a time; the pieces that still fail
+        are left in the nodes as Unparsed objects, which are also listed in
+        the `errors` attribute of the context returned.  (A control block,
+        such as an 'if' statement, fails as a whole, and so does a function
+        definition whose header fails or whose form the parser cannot take
+        apart.)  parse_string() and parse_file() then only raise exceptions
+        for errors other than parsing errors.
+
+        If `share_leaves` is True, equal Identifier and Number nodes in the
+        results of a parse are replaced by a single node each (see
+        LeafSharer in matlab.py), which reduces memory use on large inputs.
+        Callers must then not modify those nodes in place.  If `flatten` is
+        True, chains of three or more operands joined by +, *, && or || are
+        represented by single NaryOp nodes instead of nested BinaryOp nodes
+        (see OperatorFlattener in matlab.py)."""
+        self._cache = cache
+        self._packrat = packrat_policy(packrat)
+        self._workers = workers
+        self._lazy = lazy
+        self._memo = memo
+        self._fast_path = FastPath() if fast_path is True else fast_path
+        self._profile = profile
+        self._trace = trace
+        self._budget = budget
+        self._recover = recover
+        self._share = share_leaves
+        self._flatten = flatten
+        self.packrat_stats = None
         self._init_grammar_names()
         # self._init_parse_actions()
-        self._print_debug(False)
         self._reset()
 
 
@@ -2210,6 +3080,9 @@ class MatlabParser:
 
 
     def _reset(self):
+        self._meter = self._budget.meter() if self._budget is not None else None
+        self._sharer = LeafSharer() if self._share else None
+        self._streaming = False
         self._context = None
         self._push_context(MatlabContext(topmost=True))
 
@@ -2225,13 +3098,16 @@ class MatlabParser:
         :param print_results: print the internal presentation of the results.
         :param fail_soft: don't raise an exception if parsing fails.
 
+        Exceeding the parser's budget (if any) raises a
+        MatlabParsingBudgetException regardless of fail_soft.
+
         Warning: print_debug produces *a lot* of output.  Don't use it on
         anything more than a few lines of input.
         """
         self._reset()
         try:
-            self._print_debug(print_debug)
-            top_context = self._do_parse(input)
+            with self._print_debug(print_debug):
+                top_context = self._cached_parse(input, not print_debug)
             if print_results:
                 self.print_parse_results(top_context)
             return top_context
@@ -2255,6 +3131,9 @@ class MatlabParser:
         :param print_results: print the internal presentation of the results.
         :param fail_soft: don't raise an exception if parsing fails.
 
+        Exceeding the parser's budget (if any) raises a
+        MatlabParsingBudgetException regardless of fail_soft.
+
         Warning: print_debug produces *a lot* of output.  Don't use it on
         anything more than a few lines of input.
         """
@@ -2262,13 +3141,15 @@ class MatlabParser:
         try:
             file = codecs.open(path)
             contents = file.read()
-            self._print_debug(print_debug)
-            top_context = self._do_parse(contents)
+            with self._print_debug(print_debug):
+                top_context = self._cached_parse(contents, not print_debug)
             top_context.file = path
             file.close()
             if print_results:
                 self.print_parse_results(top_context)
             return top_context
+        except MatlabParsingBudgetException:
+            raise
         except Exception as err:
             msg = "Error: {0}".format(err)
             if fail_soft:
@@ -2279,6 +3160,66 @@ class MatlabParser:
                 raise MatlabParsingException(msg)
 
 
+    def reparse(self, context, input):
+        """Parses `input`, normally an edited version of the text `context`
+        was parsed from, and returns a new MatlabContext.  The input is split
+        into top-level statements and function definitions, and only those
+        whose text does not appear in the input of `context` are parsed;
+        the others are copied from `context`.  The contexts and types are
+        then worked out for the whole input, as in parse_string().
+
+        `context` may be None, or a context that did not come from this
+        method, in which case everything is parsed.  Either way, the context
+        returned keeps what the next call needs (see MatlabContext.chunks).
+        Raises MatlabParsingException if parsing fails.  The parser's lazy,
+        workers and cache options are not used here: the pieces are parsed
+        in this process, function bodies included, and the parse cache is
+        neither consulted nor updated.
+        """
+        self._reset()
+        return self._parse_pieces(input, context)
+
+
+    def iter_parse(self, path):
+        """Parses the MATLAB contained in `path` one top-level construct at
+        a time.  This is a generator: for each statement or function
+        definition in the file, in order, it yields a tuple (node, context)
+        where node is a MatlabNode and context is the MatlabContext of the
+        file.  The file is read a line at a time (twice: the first pass
+        determines which grammar to use), and the nodes are not kept once
+        they have been yielded.
+
+        Unlike with parse_file(), types are inferred only from the parts of
+        the file that precede each node, and the context does not collect
+        the nodes, the function calls, or the values assigned (except those
+        of names assigned function handles, anonymous functions or other
+        names, which type inference needs).  It still records the type of
+        every name assigned, and a context for every function defined, so
+        its size grows with the number of distinct names in the file rather
+        than with the length of the file.  If share_leaves was given, leaves
+        are only shared within a top-level construct.  Raises
+        MatlabParsingException if parsing fails.
+        """
+        scanner = StatementScanner()
+        with codecs.open(path) as file:
+            for line in file:
+                scanner.feed(line)
+        self._reset()
+        self._streaming = True
+        self._push_context(MatlabContext(topmost=True))
+        top_context = self._context
+        top_context.file = path
+        leading = True
+        for node in self._iter_chunks(path, scanner.style(), top_context):
+            # As in _find_first_function(): a file that starts with a
+            # function definition (after comments) is a function file.
+            if leading and not isinstance(node, Comment):
+                leading = False
+                if isinstance(node, FunDef):
+                    top_context.name = node.name
+            yield node, top_context
+
+
     def print_parse_results(self, results, print_raw=False):
         """Prints a representation of the parsed output given in `results`.
         This is intended for debugging purposes.  If `print_raw` is True,
@@ -2291,6 +3232,9 @@ class MatlabParser:
         """
         if not isinstance(results, MatlabContext):
             raise ValueError("Expected a MatlabContext object")
+        # Parse any function bodies left unparsed by a lazy parse.
+        for name in results.functions.pending():
+            results.functions[name]
         if print_raw:
             print('[')
             for node in results.nodes:
@@ -2316,71 +3260,102 @@ class MatlabParser:
         If no 'atrans' is given, the default behavior is to render arrays
         as they would appear in Matlab text: e.g., "foo(2,3)".
         """
-        def compose(name, args, delimiters=None, add_spaces=spaces):
-            list = [MatlabParser.make_formula(arg, spaces, parens, atrans)
-                    for arg in (args or [])]
+        # The formula of a thing is made from the formulas of its parts.
+        # Expressions can be nested very deeply (e.g., long sums), so rather
+        # than recursing, parts() returns the parts of a thing along with a
+        # function that makes its formula from theirs, and the loop at the
+        # end works through them with a stack.
+        def compose(name, texts, delimiters=None, add_spaces=spaces):
             sep = ' ' if add_spaces else ''
             front = name if name else ''
             left = delimiters[0] if delimiters else ''
             right = delimiters[1] if delimiters else ''
-            return front + left + sep.join(list) + right
-
-        recurse = MatlabParser.make_formula
-        if isinstance(thing, str):
-            return thing
-        elif isinstance(thing, Primitive):
-            return MatlabNode.as_string(thing.value)
-        elif isinstance(thing, Identifier):
-            return MatlabNode.as_string(thing.name)
-        elif isinstance(thing, ArrayRef) or isinstance(thing, Ambiguous):
-            if atrans:
-                return atrans(thing)
-            if isinstance(thing.name, Identifier):
-                aname = thing.name.name
-            else:
-                aname = recurse(thing.name, spaces, parens, atrans)
-            return compose(aname, thing.args, '()')
-        elif isinstance(thing, FunCall):
-            return compose(thing.name.name, thing.args, '()')
-        elif (isinstance(thing, StructRef) or isinstance(thing, FuncHandle)
-              or isinstance(thing, AnonFun)):
-            # FIXME: we don't have a sensible equivalent in SBML.
-            return MatlabNode.as_string(thing)
-        elif isinstance(thing, Operator):
-            if isinstance(thing, UnaryOp):
-                operand = recurse(thing.operand, spaces, parens, atrans)
-                return compose(None, [thing.op, operand], '()', False)
-            elif isinstance(thing, BinaryOp):
-                left = recurse(thing.left, spaces, parens, atrans)
-                right = recurse(thing.right, spaces, parens, atrans)
-                return compose(None, [left, thing.op, right], '()')
-            elif isinstance(thing, ColonOp):
-                # FIXME: we don't have a sensible equivalent in SBML.
-                left = recurse(thing.left, spaces, parens, atrans)
-                right = recurse(thing.right, spaces, parens, atrans)
-                if thing.middle:
-                    middle = recurse(thing.middle, spaces, parens, atrans)
-                    return left + ':' + middle + ':' + right
-                else:
-                    return left + ':' + right
-            elif isinstance(thing, Transpose):
+            return front + left + sep.join(texts) + right
+
+        def parts(thing):
+            if isinstance(thing, str):
+                return [], lambda texts: thing
+            elif isinstance(thing, Primitive):
+                return [], lambda texts: MatlabNode.as_string(thing.value)
+            elif isinstance(thing, Identifier):
+                return [], lambda texts: MatlabNode.as_string(thing.name)
+            elif isinstance(thing, ArrayRef) or isinstance(thing, Ambiguous):
+                if atrans:
+                    return [], lambda texts: atrans(thing)
+                args = thing.args or []
+                if isinstance(thing.name, Identifier):
+                    aname = thing.name.name
+                    return args, lambda texts: compose(aname, texts, '()')
+                return ([thing.name] + args,
+                        lambda texts: compose(texts[0], texts[1:], '()'))
+            elif isinstance(thing, FunCall):
+                name = thing.name.name
+                return thing.args or [], lambda texts: compose(name, texts, '()')
+            elif (isinstance(thing, StructRef) or isinstance(thing, FuncHandle)
+                  or isinstance(thing, AnonFun)):
                 # FIXME: we don't have a sensible equivalent in SBML.
-                return recurse(thing.operand, spaces, parens, atrans) + thing.op
-
-        elif isinstance(thing, Array):
-            # FIXME: we don't have arrays in core SBML.
-            return compose(None, thing.rows, '[]')
-
-        elif isinstance(thing, list):
-            return compose(None, thing, '()')
-        elif 'comment' in thing:
-            return ''
-        else:
-            # The remaining cases are things like command statements.  Those
-            # shouldn't end up being called for make_formula.  Rather than
-            # raise an error, though, this just returns None and lets the
-            # caller deal with the problem.
-            return None
+                return [], lambda texts: MatlabNode.as_string(thing)
+            elif isinstance(thing, Operator):
+                if isinstance(thing, UnaryOp):
+                    return ([thing.operand],
+                            lambda texts: compose(None, [thing.op, texts[0]],
+                                                  '()', False))
+                elif isinstance(thing, BinaryOp):
+                    return ([thing.left, thing.right],
+                            lambda texts: compose(None, [texts[0], thing.op,
+                                                         texts[1]], '()'))
+                elif isinstance(thing, NaryOp):
+                    # The operators go between the operands, all within
+                    # one pair of parentheses.
+                    def build(texts):
+                        terms = [thing.op] * (2 * len(texts) - 1)
+                        terms[::2] = texts
+                        return compose(None, terms, '()')
+                    return thing.operands, build
+                elif isinstance(thing, ColonOp):
+                    # FIXME: we don't have a sensible equivalent in SBML.
+                    if thing.middle:
+                        return ([thing.left, thing.middle, thing.right],
+                                lambda texts: ':'.join(texts))
+                    else:
+                        return [thing.left, thing.right], lambda texts: ':'.join(texts)
+                elif isinstance(thing, Transpose):
+                    # FIXME: we don't have a sensible equivalent in SBML.
+                    return [thing.operand], lambda texts: texts[0] + thing.op
+                return [], lambda texts: None
+
+            elif isinstance(thing, Array):
+                # FIXME: we don't have arrays in core SBML.
+                return thing.rows, lambda texts: compose(None, texts, '[]')
+
+            elif isinstance(thing, list):
+                return thing, lambda texts: compose(None, texts, '()')
+            elif 'comment' in thing:
+                return [], lambda texts: ''
+            else:
+                # The remaining cases are things like command statements.
+                # Those shouldn't end up being called for make_formula.
+                # Rather than raise an error, though, this just returns None
+                # and lets the caller deal with the problem.
+                return [], lambda texts: None
+
+        # The stack holds things still to be taken apart and, below their
+        # parts, _Formula records for the things they belong to.  The
+        # formulas of finished things are pushed on `texts`.
+        texts = []
+        stack = [thing]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, _Formula):
+                start = len(texts) - item.count
+                done = texts[start:]
+                del texts[start:]
+                texts.append(item.build(done))
+            else:
+                subparts, build = parts(item)
+                stack.append(_Formula(len(subparts), build))
+                stack.extend(reversed(subparts))
+        return texts[0]
 
 
 # Notes about dealing with the intermediate PyParsing-based representation.
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import copy
+import pytest
+import sys
+sys.path.append('.')
+sys.path.append('../..')
+from moccasin.errors import ArrayOperatorInputError
+from moccasin.interfaces.controller import Controller
+from moccasin.matlab_parser.matlab import BinaryOp, Identifier
+
+_INPUT = '''x0 = [1; 2];
+k = 3;
+[t, y] = ode45(@f, [0 10], x0);
+
+function dy = f(t, y)
+  dy = [-k * y(1); k * y(1)];
+end
+'''
+
+def test_first_edit_is_incremental():
+    controller = Controller()
+    controller.parse_contents(_INPUT)
+    first = controller.parse_results
+    assert first.chunks is not None
+    controller.parse_contents(_INPUT.replace('k = 3;', 'k = 4;'))
+    added = set(controller.parse_results.chunks[1]) - set(first.chunks[1])
+    assert added == set(['k = 4;\n'])
+
+
+def test_options_reparsing_ignores():
+    controller = Controller(lazy=True)
+    controller.parse_contents(_INPUT)
+    assert controller.parse_results.chunks is None
+
+
+def long_sum(term, depth, first_op='+'):
+    node = BinaryOp(op=first_op, left=copy.deepcopy(term), right=copy.deepcopy(term))
+    for i in range(2, depth):
+        node = BinaryOp(op='+', left=node, right=copy.deepcopy(term))
+    return node
+
+
+def test_long_sum_converts():
+    # Parsing a sum this long takes a while, so it is put in place of the
+    # parsed right-hand side instead.
+    depth = 10000
+    controller = Controller()
+    controller.parse_contents(_INPUT)
+    rhs = controller.parse_results.functions[Identifier(name='f')].nodes[0].rhs
+    term = rhs.rows[1][0]
+    rhs.rows = [[long_sum(term, depth, first_op='.*')], [term]]
+    with pytest.raises(ArrayOperatorInputError):
+        controller.check_translatable()
+    rhs.rows = [[long_sum(term, depth)], [term]]
+    assert controller.check_translatable()
+    output = controller.build_model(False, 'xpp', False, False)
+    assert output.count('(k * y_1)') == depth + 1
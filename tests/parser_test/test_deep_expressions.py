@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.matlab import ArrayRef, BinaryOp, Identifier, MatlabNode, \
+    MatlabNodeVisitor, Number
+
+# Deeper than any recursion limit the parser sets.
+_DEPTH = 20000
+
+def long_sum(depth):
+    node = Identifier(name='a0')
+    for i in range(1, depth):
+        node = BinaryOp(op='+', left=node, right=Identifier(name='a%d' % i))
+    return node
+
+
+class Names(MatlabNodeVisitor):
+    def __init__(self):
+        super(Names, self).__init__()
+        self.names = []
+
+    def visit_Identifier(self, node):
+        self.names.append(node.name)
+        return node
+
+
+class Renamer(MatlabNodeVisitor):
+    def visit_Identifier(self, node):
+        return Identifier(name=node.name.upper())
+
+
+def test_as_string():
+    node = long_sum(_DEPTH)
+    text = '+'.join('a%d' % i for i in range(_DEPTH))
+    assert MatlabNode.as_string(node) == text
+    assert hash(node) == hash(text)
+    assert MatlabNode.as_string(node.left) == text[:text.rindex('+')]
+
+
+def test_make_formula():
+    node = long_sum(_DEPTH)
+    formula = MatlabParser.make_formula(node, spaces=False)
+    assert formula == '(' * (_DEPTH - 1) + 'a0+' + ')+'.join(
+        'a%d' % i for i in range(1, _DEPTH)) + ')'
+    node = BinaryOp(op='*', left=Number(value='2'),
+                    right=ArrayRef(name=Identifier(name='x'), is_cell=False,
+                                   args=[Identifier(name='i'), Number(value='1')]))
+    assert MatlabParser.make_formula(node) == '(2 * x(i 1))'
+    assert MatlabParser.make_formula(node, atrans=lambda a: 'y') == '(2 * y)'
+
+
+def test_visitor():
+    node = long_sum(_DEPTH)
+    visitor = Names()
+    assert visitor.visit([node, (node.right, None)]) == [node, (node.right, None)]
+    assert visitor.names == ['a%d' % i for i in range(_DEPTH)] + ['a%d' % (_DEPTH - 1)]
+    node = Renamer().visit(node)
+    assert MatlabNode.as_string(node).startswith('A0+A1+A2')
+
+
+def test_parse_long_sum():
+    terms = ['a%d' % i for i in range(100)]
+    node = MatlabParser().parse_string('x = ' + ' - '.join(terms) + ';\n').nodes[0].rhs
+    assert isinstance(node, BinaryOp) and node.op == '-'
+    assert node.right.name == Identifier(name='a99')
+    assert node.left.right.name == Identifier(name='a98')
+    assert MatlabNode.as_string(node) == '-'.join(terms)
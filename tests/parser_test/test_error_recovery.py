@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser, StatementMemo
+from matlab_parser.matlab import Assignment, FunDef, Identifier, Unparsed
+from matlab_parser.parser import MatlabParsingException
+
+_INPUT = '''a = 1;
+b = 2 +* 3;
+c = 3;
+function y = f(x)
+  y = x + ;
+  z = 2;
+end
+function g()
+  if a
+    q = 3 +* 2;
+  end
+end
+'''
+
+def spans(context):
+    return [(node.first_line, node.last_line) for node in context.errors]
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'fast_path': True},
+    {'memo': StatementMemo()},
+])
+def test_recovery(options):
+    context = MatlabParser(recover=True, **options).parse_string(_INPUT)
+    assert spans(context) == [(2, 2), (5, 5), (9, 11)]
+    assert context.errors[0].text == 'b = 2 +* 3;\n'
+    assert 'line 2, column 7' in context.errors[0].message
+    nodes = context.nodes
+    assert [type(node) for node in nodes] == [Assignment, Unparsed, Assignment,
+                                              FunDef, FunDef]
+    assert nodes[1] is context.errors[0]
+    assert [type(node) for node in nodes[3].body] == [Unparsed, Assignment]
+    assert Identifier(name='z') in context.functions[Identifier(name='f')].assignments
+
+
+def test_no_errors():
+    text = 'a = 1;\nb = a + 2;\n'
+    context = MatlabParser(recover=True).parse_string(text)
+    assert context.errors == []
+    assert repr(context.nodes) == repr(MatlabParser().parse_string(text).nodes)
+
+
+def test_without_recovery():
+    with pytest.raises(MatlabParsingException):
+        MatlabParser().parse_string(_INPUT)
+    assert MatlabParser().parse_string(_INPUT, fail_soft=True) is None
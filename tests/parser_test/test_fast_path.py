@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser, FastPath
+
+_MODEL = '''% Parameters
+k1 = 0.0058 * 60;    % per minute
+k2 = -2^2 + 2^-2*3 - (k1 - -1e-3) ./ 4.;
+
+x0 = [0; 0];
+tspan = [0 -300 1];
+[t, y] = ode45(@f, tspan, x0);
+z = f(k1)';
+'''
+
+def raw_nodes(text):
+    parser = MatlabParser()
+    return parser._chunk_nodes(parser._grammar_for_style(None), text, 1)
+
+
+@pytest.mark.parametrize('text', [
+    'k1 = 0.0058 * 60;\n',
+    'x0 = [0; 0];\n',
+    'a = b + -c*2^3 - 1e-3 % note\n',
+    'a = -2^2;\n',
+    'a = 2^-2*3;\n',
+    'a = 1.*2;\n',
+    'a = 1 - - 2,\n',
+    'a = (x + 1) / .5;',
+    'a = [1 -2 +3];\n',
+    'a = [1, 2; 3 4];\n',
+    'a = [ ];\n',
+    '  % just a comment\n',
+    '\n',
+])
+def test_same_nodes_as_grammar(text):
+    nodes = FastPath().parse(text)
+    assert nodes is not None
+    assert repr(nodes) == repr(raw_nodes(text))
+
+
+@pytest.mark.parametrize('text', [
+    'a = f(1);\n',
+    'a = x\';\n',
+    'a = [1 - 2];\n',
+    'a = [1 2, 3];\n',
+    'a = --2;\n',
+    'a = 1 %{\n',
+    'a == 1;\n',
+    'end = 1;\n',
+    'a = end;\n',
+    'a = 1; b = 2;\n',
+    'a = 1 + ...\n  2;\n',
+    'a = 1;\nb = 2;\n',
+    '%{\n',
+])
+def test_others_left_to_grammar(text):
+    fast_path = FastPath()
+    assert fast_path.parse(text) is None
+    assert (fast_path.hits, fast_path.misses) == (0, 1)
+
+
+def test_fast_path_parse_matches():
+    fast_path = FastPath()
+    context = MatlabParser(fast_path=fast_path).parse_string(_MODEL)
+    plain = MatlabParser().parse_string(_MODEL)
+    assert [repr(node) for node in context.nodes] == [repr(node) for node in plain.nodes]
+    assert (fast_path.hits, fast_path.misses) == (6, 2)
+
+
+def test_fast_path_parse_error(capsys):
+    text = 'a = 1;\nb = (2;\n'
+    assert MatlabParser().parse_string(text, fail_soft=True) is None
+    plain = capsys.readouterr().out
+    assert MatlabParser(fast_path=True).parse_string(text, fail_soft=True) is None
+    assert capsys.readouterr().out == plain
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.grammar_utils import function_style
+from matlab_parser.parser import MatlabParsingException
+
+_DEEP = '''function a(x)
+  if x(end) > 1, y = 'end'; end
+  function b
+    hold on % end
+  end
+end
+'''
+
+_SHALLOW = '''function a(x)
+  for i = 1:x
+    v(end) = i';
+  end
+function b
+  % end
+  try, x = 1; catch, end
+'''
+
+_MIXED = '''function a
+  x = 1;
+end
+function b
+  y = 2;
+'''
+
+def test_function_style():
+    assert function_style(_DEEP) == 'deep'
+    assert function_style(_SHALLOW) == 'shallow'
+    assert function_style(_MIXED) == 'mixed'
+    assert function_style('x = 1;\nif x, y = 2; end\n') is None
+
+
+def test_mixed_files_are_rejected():
+    parser = MatlabParser()
+    assert len(parser.parse_string(_DEEP).nodes) == 1
+    assert len(parser.parse_string(_SHALLOW).nodes) == 2
+    with pytest.raises(MatlabParsingException):
+        parser.parse_string(_MIXED)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import json
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser, GrammarProfile
+
+_INPUT = '''function dy = f(t, y)
+  k = [1 2; 3 4];
+  dy = -k * y + sin(t);
+end
+'''
+
+def test_profile_counts():
+    profile = GrammarProfile()
+    context = MatlabParser(profile=profile).parse_string(_INPUT)
+    plain = MatlabParser().parse_string(_INPUT)
+    assert repr(context.nodes) == repr(plain.nodes)
+    rules = dict((rule.name, rule) for rule in profile.stats())
+    assert '_expr' in rules
+    for rule in rules.values():
+        assert rule.attempts == rule.successes + rule.failures
+        assert rule.time >= 0
+    assert sum(rule.packrat_hits for rule in rules.values()) > 0
+
+
+def test_profile_accumulates_and_restores():
+    profile = GrammarProfile()
+    parser = MatlabParser(profile=profile)
+    parser.parse_string('a = 1;\n')
+    first = dict((rule.name, rule.attempts) for rule in profile.stats())
+    parser.parse_string('a = 1;\n')
+    second = dict((rule.name, rule.attempts) for rule in profile.stats())
+    assert all(second[name] == 2 * first[name] for name in first)
+    assert not any(obj.debug for obj in MatlabParser._to_name)
+
+
+def test_profile_sorting():
+    profile = GrammarProfile()
+    MatlabParser(profile=profile).parse_string(_INPUT)
+    failures = [rule.failures for rule in profile.stats('failures')]
+    assert failures == sorted(failures, reverse=True)
+    names = [rule.name for rule in profile.stats('name')]
+    assert names == sorted(names)
+    with pytest.raises(ValueError):
+        profile.stats('bogus')
+
+
+def test_profile_reports():
+    profile = GrammarProfile()
+    MatlabParser(profile=profile).parse_string(_INPUT)
+    lines = profile.report(limit=3).splitlines()
+    assert len(lines) == 4
+    assert lines[0].split()[:2] == ['rule', 'attempts']
+    rules = json.loads(profile.to_json(sort_by='attempts'))
+    assert rules[0]['attempts'] == max(rule['attempts'] for rule in rules)
+    assert set(rules[0]) == set(['name', 'attempts', 'successes', 'failures',
+                                 'packrat_hits', 'time'])
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import io
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser, GrammarProfile, GrammarTrace
+
+def debug_flags():
+    return [obj.debug for obj in MatlabParser._to_name]
+
+
+def test_trace_ring_buffer():
+    trace = GrammarTrace(size=5)
+    MatlabParser(trace=trace).parse_string('a = b + 1;\n')
+    assert len(trace.lines) == 5
+    assert not any(debug_flags())
+    trace.clear()
+    assert trace.lines == []
+
+
+def test_trace_to_file_with_rules():
+    output = io.StringIO()
+    trace = GrammarTrace(file=output, rules=['_assignment', '_NUMBER'])
+    MatlabParser(trace=trace).parse_string('a = 1;\n')
+    lines = output.getvalue().splitlines()
+    assert lines and trace.lines == []
+    assert all('_assignment' in line or '_NUMBER' in line
+               for line in lines if not line.startswith('Exception'))
+    assert "Matched _NUMBER -> ['1']" in lines
+
+
+def test_trace_and_profile_together():
+    trace = GrammarTrace(rules=['_assignment'])
+    profile = GrammarProfile()
+    MatlabParser(trace=trace, profile=profile).parse_string('a = 1;\n')
+    assert any(line.startswith('Match _assignment') for line in trace.lines)
+    assert dict((rule.name, rule.successes)
+                for rule in profile.stats())['_assignment'] == 1
+    assert not any(debug_flags())
+
+
+def test_print_debug_is_scoped(capsys):
+    parser = MatlabParser()
+    parser.parse_string('a = 1;\n', print_debug=True)
+    assert 'Match _assignment' in capsys.readouterr().out
+    assert not any(debug_flags())
+    parser.parse_string('a = 1;\n')
+    assert capsys.readouterr().out == ''
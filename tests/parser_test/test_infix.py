@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser.grammar_utils import InfixExpression, makeLRlike, \
+    set_packrat_policy
+from pyparsing import Group, Literal, ParseException, Regex, infixNotation, \
+    opAssoc
+
+_operand = Regex(r'\w+')
+_operators = [
+    (Group(Literal("'")),                 1, opAssoc.LEFT, makeLRlike(1)),
+    (Group(Literal('^')),                 2, opAssoc.LEFT, makeLRlike(2)),
+    (Group(Regex(r'[-+]')),               1, opAssoc.RIGHT),
+    (Group(Regex(r'[*/]')),               2, opAssoc.LEFT, makeLRlike(2)),
+    (Group(Regex(r'[-+]')),               2, opAssoc.LEFT, makeLRlike(2)),
+    ((Group(Literal(':')), Group(Literal(':'))), 3, opAssoc.LEFT, makeLRlike(3)),
+    (Group(Literal(':')),                 2, opAssoc.LEFT, makeLRlike(2)),
+    (Group(Literal('=')),                 2, opAssoc.RIGHT),
+]
+
+_INPUTS = ['a', 'a + b', 'a - b * c + d', "a'' ^ b", '-a ^ b', '- - a * b',
+           '(a + b) * (c - d)', 'a:b:c', 'a:b:c:d', 'a : b', 'a = b = c + d',
+           "((a))'", 'a * b / c * d - e - f']
+
+
+def test_same_as_infix_notation():
+    # infixNotation() is impractically slow without memoization.
+    set_packrat_policy(True)
+    plain = infixNotation(_operand, _operators)
+    climbing = InfixExpression(_operand, _operators)
+    for text in _INPUTS:
+        assert climbing.parseString(text, parseAll=True).asList() \
+            == plain.parseString(text, parseAll=True).asList()
+
+
+def test_partial_match():
+    climbing = InfixExpression(_operand, _operators)
+    assert climbing.parseString('a + * b').asList() == ['a']
+    with pytest.raises(ParseException):
+        climbing.parseString('* b')
+
+
+def test_bad_operator_table():
+    with pytest.raises(ValueError):
+        InfixExpression(_operand, [(Literal('+'), 4, opAssoc.LEFT)])
+    with pytest.raises(ValueError):
+        InfixExpression(_operand, [(Literal('?'), 3, opAssoc.LEFT)])
+
+
+def test_name():
+    climbing = InfixExpression(_operand, _operators)
+    assert str(climbing) == 'expression'
+    assert climbing._generateDefaultName() == 'expression'
+    assert str(climbing.setName('_expr')) == '_expr'
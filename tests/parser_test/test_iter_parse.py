@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.grammar_utils import top_level_chunks
+from matlab_parser.matlab import MatlabNode
+from matlab_parser.parser import MatlabParsingException
+
+_SCRIPT = '''% leading comment
+x = [1 2
+     3 4];
+if x(end) > 1, y = 'end'; end
+z = x + ...
+    1;
+%{
+  block comment
+%}
+'''
+
+_SHALLOW = '''function a(x)
+  for i = 1:x
+    v(end) = i';
+  end
+% between
+function b
+  y = 2;
+'''
+
+_DEEP = '''function a(x)
+  y = b(x);
+  function r = b(z)
+    r = z;
+  end
+end
+% after
+'''
+
+def lines_of(text):
+    return text.splitlines(True)
+
+
+def test_chunks_script():
+    chunks = list(top_level_chunks(lines_of(_SCRIPT), None))
+    assert [first for _, first in chunks] == [1, 2, 4, 5, 7]
+    assert ''.join(chunk for chunk, _ in chunks) == _SCRIPT
+
+
+def test_chunks_functions():
+    shallow = list(top_level_chunks(lines_of(_SHALLOW), 'shallow'))
+    assert [first for _, first in shallow] == [1, 6]
+    deep = list(top_level_chunks(lines_of(_DEEP), 'deep'))
+    assert [first for _, first in deep] == [1, 7]
+
+
+@pytest.mark.parametrize('text', [_SCRIPT, _SHALLOW, _DEEP])
+def test_iter_parse_matches_parse_file(tmpdir, text):
+    path = str(tmpdir.join('input.m'))
+    with open(path, 'w') as file:
+        file.write(text)
+    eager = MatlabParser().parse_file(path)
+    streamed = list(MatlabParser().iter_parse(path))
+    assert [repr(node) for node, _ in streamed] \
+        == [repr(node) for node in eager.nodes]
+    context = streamed[0][1]
+    assert all(c is context for _, c in streamed)
+    assert context.file == path
+    assert context.name == eager.name
+
+
+def test_iter_parse_reports_line(tmpdir):
+    path = str(tmpdir.join('bad.m'))
+    with open(path, 'w') as file:
+        file.write('x = 1;\ny = 2;\nz = (3;\n')
+    nodes = MatlabParser().iter_parse(path)
+    assert next(nodes)[0].lhs.name == 'x'
+    next(nodes)
+    with pytest.raises(MatlabParsingException) as info:
+        next(nodes)
+    assert 'line 3' in str(info.value)
+
+
+def test_iter_parse_keeps_only_names(tmpdir):
+    path = str(tmpdir.join('params.m'))
+    with open(path, 'w') as file:
+        for i in range(50):
+            file.write('k%d = [%d %d];\n' % (i, i, i + 1))
+        file.write('g = @sin;\nh = g;\ny = h(k1);\nk2 = sin(k3);\n')
+    eager = MatlabParser().parse_file(path)
+    streamed = list(MatlabParser(share_leaves=True).iter_parse(path))
+    context = streamed[0][1]
+    assert context.types == eager.types
+    assert sorted(MatlabNode.as_string(name) for name in context.assignments) \
+        == ['g', 'h']
+    assert not context.calls
+    assert [repr(node) for node, _ in streamed] \
+        == [repr(node) for node in eager.nodes]
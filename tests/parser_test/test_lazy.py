@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.grammar_utils import inline_function
+from matlab_parser.parser import MatlabParsingException
+
+_INPUT = '''function dy = f(t, y)
+  % ODE function
+  k = rates(2);
+  dy = -k * y;
+end
+
+function k = rates(n)
+  k = ones(1, n);
+  function q = inner
+    q = 1;
+  end
+end
+
+function show(t, y)
+  plot(t, y);
+end % trailing
+'''
+
+def summary(context):
+    functions = {}
+    for name, fun in context.functions.items():
+        functions[repr(name)] = summary(fun)
+    return ([repr(node) for node in (context.nodes or [])], repr(context.name),
+            functions, sorted(repr(name) for name in context.calls))
+
+
+def test_lazy_defers_bodies():
+    context = MatlabParser(lazy=True).parse_string(_INPUT)
+    assert [name.name for name in context.functions.pending()] == ['f', 'rates', 'show']
+    assert not context.nodes[1].body
+    rates = context.functions[context.nodes[1].name]
+    assert [name.name for name in context.functions.pending()] == ['f', 'show']
+    assert [name.name for name in rates.functions] == ['inner']
+    assert rates.parent is context
+
+
+def test_lazy_matches_eager():
+    eager = MatlabParser().parse_string(_INPUT)
+    lazy = MatlabParser(lazy=True).parse_string(_INPUT)
+    assert summary(lazy) == summary(eager)
+
+
+def test_lazy_error_on_access():
+    text = _INPUT + '\nfunction g\n  x = (1;\nend\n'
+    context = MatlabParser(lazy=True).parse_string(text)
+    context.functions[context.nodes[0].name]
+    with pytest.raises(MatlabParsingException):
+        context.functions[context.nodes[-1].name]
+
+
+def test_inline_function():
+    assert not inline_function('function a\n  x = 1; % function b\nend\n')
+    assert inline_function('function a\nend function b\nend\n')
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from pyparsing import Forward, Group, Literal, Optional, ParseException, \
+    Word, ZeroOrMore, alphas, nums
+from matlab_parser.grammar_utils import leave_whitespace
+
+def grammar():
+    inner = Forward()
+    item = Group(Word(alphas) | Word(nums) + Optional(Literal('!')))
+    inner <<= item
+    return ZeroOrMore(Literal(',') + inner) + Literal(';')
+
+
+def shape(expr, seen):
+    # The element types, the whitespace flags and which elements are shared.
+    if id(expr) in seen:
+        return seen[id(expr)]
+    seen[id(expr)] = len(seen)
+    children = getattr(expr, 'exprs', None) or []
+    if getattr(expr, 'expr', None) is not None:
+        children = [expr.expr]
+    if isinstance(expr, Forward):
+        children = []
+    return (type(expr).__name__, expr.skipWhitespace,
+            [shape(child, seen) for child in children])
+
+
+def test_same_as_pyparsing():
+    expr = grammar()
+    assert shape(leave_whitespace(expr), {}) == shape(grammar().leaveWhitespace(), {})
+
+
+def test_whitespace_significant():
+    expr = leave_whitespace(grammar())
+    assert len(expr.parseString(',a,1!;')) == 5
+    with pytest.raises(ParseException):
+        expr.parseString(',a ;')
+    assert len(grammar().parseString(',a ;')) == 3
+
+
+def test_original_untouched():
+    item = Word(alphas)
+    expr = Optional(item) + Literal(';')
+    leave_whitespace(expr)
+    assert item.skipWhitespace
+    assert not expr.exprs[0].expr.skipWhitespace
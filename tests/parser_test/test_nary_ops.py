@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.matlab import BinaryOp, Identifier, MatlabNode, NaryOp, \
+    OperatorFlattener
+
+_VARS = ('a = 1; b = 1; c = 1; d = 1; k = 1; p = 1; q = 1; r = 1; s = 1;\n'
+         'z = 1; y = [1];\n')
+
+def rhs(text, **options):
+    return MatlabParser(**options).parse_string(_VARS + text + '\n').nodes[-1].rhs
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('x = a + b;',
+     "BinaryOp(op='+', left=Identifier(name='a'), right=Identifier(name='b'))"),
+    ('x = a + b + c;',
+     "NaryOp(op='+', operands=[Identifier(name='a'), Identifier(name='b'), "
+     "Identifier(name='c')])"),
+    ('x = a * b * c + d;',
+     "BinaryOp(op='+', left=NaryOp(op='*', operands=[Identifier(name='a'), "
+     "Identifier(name='b'), Identifier(name='c')]), right=Identifier(name='d'))"),
+    ('x = a - b - c;',
+     "BinaryOp(op='-', left=BinaryOp(op='-', left=Identifier(name='a'), "
+     "right=Identifier(name='b')), right=Identifier(name='c'))"),
+    ('x = a + (b + c) + d;',
+     "NaryOp(op='+', operands=[Identifier(name='a'), BinaryOp(op='+', "
+     "left=Identifier(name='b'), right=Identifier(name='c')), Identifier(name='d')])"),
+    ('x = p && q && r || s;',
+     "BinaryOp(op='||', left=NaryOp(op='&&', operands=[Identifier(name='p'), "
+     "Identifier(name='q'), Identifier(name='r')]), right=Identifier(name='s'))"),
+])
+def test_flatten(text, expected):
+    node = rhs(text, flatten=True)
+    assert repr(node) == expected
+    assert MatlabNode.as_string(node) == MatlabNode.as_string(rhs(text))
+
+
+def test_make_formula():
+    node = rhs('x = 2*y(1)*k + z;', flatten=True)
+    assert MatlabParser.make_formula(node) == '((2 * y(1) * k) + z)'
+    assert MatlabParser.make_formula(node, spaces=False) == '((2*y(1)*k)+z)'
+
+
+def test_long_sum():
+    depth = 20000
+    node = Identifier(name='a0')
+    for i in range(1, depth):
+        node = BinaryOp(op='+', left=node, right=Identifier(name='a%d' % i))
+    text = MatlabNode.as_string(node)
+    node = OperatorFlattener().visit(node)
+    assert isinstance(node, NaryOp) and len(node.operands) == depth
+    assert MatlabNode.as_string(node) == text
+    assert MatlabParser.make_formula(node, spaces=False) == '(' + text + ')'
+
+
+def test_contexts_use_flattened_nodes():
+    context = MatlabParser(flatten=True).parse_string('x = a + b + c;\n')
+    assert isinstance(context.assignments[Identifier(name='x')], NaryOp)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import copy
+import pickle
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser.matlab import ArrayRef, BinaryOp, Identifier, MatlabNode, \
+    MatlabNodeVisitor, Number, UnaryOp
+
+def expr():
+    return BinaryOp(op='+', left=Identifier(name='a'),
+                    right=ArrayRef(name=Identifier(name='x'),
+                                   args=[Number(value='1')], is_cell=False))
+
+
+class Renumber(MatlabNodeVisitor):
+    def visit_Number(self, node):
+        node.value = '2'
+        return node
+
+
+def test_hash_is_kept():
+    node = expr()
+    assert hash(node) == hash('a+x(1)')
+    assert node._as_string == 'a+x(1)'
+    assert node.right._as_string == 'x(1)'
+
+
+def test_setting_attribute_drops_hash():
+    node = expr()
+    hash(node)
+    node.op = '-'
+    assert not isinstance(node._as_string, str)
+    assert MatlabNode.as_string(node) == 'a-x(1)'
+
+
+def test_visitor_updates_parents():
+    node = expr()
+    hash(node)
+    node = Renumber().visit(node)
+    assert MatlabNode.as_string(node) == 'a+x(2)'
+    assert hash(node) == hash('a+x(2)')
+
+
+def test_invalidate():
+    node = expr()
+    hash(node)
+    node.right.args.append(Number(value='3'))
+    node.right.invalidate()
+    node.invalidate()
+    assert MatlabNode.as_string(node) == 'a+x(1,3)'
+
+
+def test_equality():
+    first, second = expr(), expr()
+    assert first == second
+    hash(first)
+    assert first == second and second == first
+    hash(second)
+    assert first == second
+    third = expr()
+    third.right.args[0].value = '5'
+    hash(third)
+    assert first != third and third != first
+    assert BinaryOp(op='+', left=Identifier(name='a'), right=Identifier(name='b')) \
+        != BinaryOp(op='+', left=Identifier(name='a'), right=Number(value='b'))
+
+
+def test_equality_after_change_below_cached_parent():
+    first = UnaryOp(op='-', operand=Number(value='1e3'))
+    second = UnaryOp(op='-', operand=Number(value='1000'))
+    hash(first)
+    hash(second)
+    first.operand.value = '1000'
+    assert first == second and second == first
+
+
+def test_copies():
+    node = expr()
+    hash(node)
+    assert copy.deepcopy(node) == node
+    assert pickle.loads(pickle.dumps(node)) == node
+    assert len(set([node, copy.deepcopy(node), expr()])) == 1
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import copy
+import pickle
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.matlab import ArrayRef, BinaryOp, Identifier, LeafSharer, \
+    MatlabNode, Number, NumericArray
+
+_INPUT = '''function y = f(x)
+  y = x + 1;
+  z = x * 1;
+end
+a = f(1);
+'''
+
+def expr():
+    return BinaryOp(op='+', left=Identifier(name='a'),
+                    right=ArrayRef(name=Identifier(name='x'),
+                                   args=[Number(value='1')], is_cell=False))
+
+
+def test_no_dict():
+    node = expr()
+    assert not hasattr(node, '__dict__')
+    assert not hasattr(node.right.args[0], '__dict__')
+    with pytest.raises(AttributeError):
+        node.bogus = 1
+
+
+def test_construction_and_repr():
+    assert repr(Identifier('a')) == repr(Identifier(name='a'))
+    assert repr(expr()) == ("BinaryOp(op='+', left=Identifier(name='a'), "
+                            "right=ArrayRef(is_cell=False, name=Identifier(name='x'), "
+                            "args=[Number(value='1')]))")
+    with pytest.raises(KeyError):
+        Identifier()
+
+
+def test_copy_and_pickle():
+    node = expr()
+    hash(node)
+    for other in [copy.copy(node), copy.deepcopy(node),
+                  pickle.loads(pickle.dumps(node))]:
+        assert other == node
+        assert hash(other) == hash(node)
+    array = NumericArray.from_text('1 2; 3 4')
+    for other in [copy.deepcopy(array), pickle.loads(pickle.dumps(array))]:
+        assert other.texts == ['1', '2', '3', '4']
+
+
+def test_leaf_sharer():
+    nodes = LeafSharer().visit([expr(), expr()])
+    assert nodes[0] == expr()
+    assert nodes[0].left is nodes[1].left
+    assert nodes[0].right.args[0] is nodes[1].right.args[0]
+    assert nodes[0].right is not nodes[1].right
+
+
+def test_parser_shares_leaves():
+    plain = MatlabParser().parse_string(_INPUT)
+    shared = MatlabParser(share_leaves=True).parse_string(_INPUT)
+    assert repr(shared.nodes) == repr(plain.nodes)
+    body = shared.nodes[0].body
+    assert body[0].rhs.left is body[1].rhs.left
+    assert body[0].rhs.right is body[1].rhs.right
+    assert body[0].rhs.right is shared.nodes[1].rhs.args[0]
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.matlab import Array, MatlabNode, Number, NumericArray
+
+def rhs(text):
+    return MatlabParser().parse_string(text + '\n').nodes[0].rhs
+
+
+@pytest.mark.parametrize('text, shape, texts', [
+    ('a = [1 2 3];',             (1, 3), ['1', '2', '3']),
+    ('a = [1, -2; +3, 4e-1];',   (2, 2), ['1', '-2', '3', '4e-1']),
+    ('a = [ .5\t1.  ];',         (1, 2), ['.5', '1.']),
+    ('a = [1;2\n3];',            (3, 1), ['1', '2', '3']),
+    ('a = [;1;;2D2;];',          (2, 1), ['1', '2D2']),
+])
+def test_numeric_arrays(text, shape, texts):
+    node = rhs(text)
+    assert isinstance(node, NumericArray)
+    assert node.shape == shape
+    assert node.texts == texts
+    assert list(node.values) == [float(t.replace('D', 'e')) for t in texts]
+
+
+@pytest.mark.parametrize('text', [
+    'a = [1 - 2];',
+    'a = [1 2; 3];',
+    'a = [1, 2, ];',
+    'a = [1 x];',
+    'a = [[1 2] 3];',
+    'a = {1 2};',
+])
+def test_other_arrays(text):
+    assert not isinstance(rhs(text), NumericArray)
+
+
+def test_same_as_array():
+    node = rhs('a = [1 -2; 3 4];')
+    rows = [[Number(value='1'), Number(value='-2')],
+            [Number(value='3'), Number(value='4')]]
+    array = Array(is_cell=False, rows=rows)
+    assert repr(node) == repr(array)
+    assert str(node) == str(array)
+    assert MatlabNode.as_string(node) == MatlabNode.as_string(array)
+    assert node == array and array == node
+    assert hash(node) == hash(array)
+    assert node.rows == rows
+
+
+def test_set_texts():
+    node = rhs('a = [1e-3 2; 3 4.];')
+    node.texts = ['0.001', '2', '3', '4']
+    assert node.shape == (2, 2)
+    assert node.texts == ['0.001', '2', '3', '4']
+    assert node.rows[0][0] == Number(value='0.001')
+
+
+def test_texts_kept():
+    node = rhs('a = [1 2; 3 4];')
+    assert node._text_list() is node._text_list()
+    node.text = '5 6;7 8'
+    assert node.texts == ['5', '6', '7', '8']
+    texts = node.texts
+    texts.append('9')
+    assert node.texts == ['5', '6', '7', '8']
+
+
+def test_rows_are_copies():
+    node = rhs('a = [1 2; 3 4];')
+    node.rows[0][0].value = '9'
+    assert node.texts == ['1', '2', '3', '4']
+    assert repr(node.rows) == repr([[Number(value='1'), Number(value='2')],
+                                    [Number(value='3'), Number(value='4')]])
+    assert MatlabNode.as_string(node) == '[1,2;3,4]'
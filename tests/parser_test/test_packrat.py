@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.grammar_utils import packrat_policy, set_packrat_policy
+from pyparsing import ParserElement
+
+_INPUT = '''
+a = [1 2 3];
+b = a(2) * 4 + sin(a(1));
+if b > 2
+  c = {a, 'x'};
+end
+'''
+
+def nodes_repr(context):
+    return [repr(node) for node in context.nodes]
+
+
+def test_packrat_policy_values():
+    assert packrat_policy('off') is False
+    assert packrat_policy('unbounded') is None
+    assert packrat_policy('250') == 250
+    assert packrat_policy(True) is None
+    assert packrat_policy(0) is False
+    with pytest.raises(ValueError):
+        packrat_policy('sometimes')
+
+
+def test_packrat_off():
+    # Parsing anything without memoization takes far too long to test, so
+    # only check that PyParsing gets configured accordingly.
+    set_packrat_policy(False)
+    assert ParserElement._parse == ParserElement._parseNoCache
+    set_packrat_policy(True)
+    assert ParserElement._parse == ParserElement._parseCache
+
+
+def test_packrat_policies_give_same_results():
+    unbounded = MatlabParser(packrat=True)
+    expected = nodes_repr(unbounded.parse_string(_INPUT))
+    for policy in [50, 1000]:
+        parser = MatlabParser(packrat=policy)
+        assert nodes_repr(parser.parse_string(_INPUT)) == expected
+
+
+def test_packrat_stats():
+    parser = MatlabParser(packrat=50)
+    parser.parse_string(_INPUT)
+    stats = parser.packrat_stats
+    assert stats.policy == 50
+    assert 0 < stats.entries <= 50
+    assert stats.peak == 50
+    assert stats.misses > 0
+    # The table must not hold on to anything between parses.
+    assert len(ParserElement.packrat_cache) == 0
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+
+_INPUT = '''function dy = f(t, y)
+  % ODE function
+  k = rates(2);
+  dy = -k * y;
+end
+
+function k = rates(n)
+  k = ones(1, n);
+end
+
+function show(t, y)
+  plot(t, y);
+end
+'''
+
+def summary(context):
+    return ([repr(node) for node in context.nodes], repr(context.name),
+            sorted(repr(name) for name in context.functions),
+            sorted(repr(name) for name in context.calls))
+
+
+def test_parallel_matches_serial():
+    serial = MatlabParser().parse_string(_INPUT)
+    parallel = MatlabParser(workers=2).parse_string(_INPUT)
+    assert summary(parallel) == summary(serial)
+    fun = parallel.functions[parallel.nodes[0].name]
+    assert fun.parent is parallel
+
+
+def test_parallel_packrat_stats():
+    parser = MatlabParser(workers=2)
+    parser.parse_string(_INPUT)
+    assert parser.packrat_stats.misses > 0
+
+
+def test_parallel_error_location(capsys):
+    text = _INPUT + '\nfunction g\n  x = (1;\n'
+    assert MatlabParser().parse_string(text, fail_soft=True) is None
+    serial = capsys.readouterr().out
+    assert MatlabParser(workers=2).parse_string(text, fail_soft=True) is None
+    assert capsys.readouterr().out == serial
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from pyparsing import ParserElement
+from matlab_parser import MatlabParser, ParseBudget, StatementMemo
+from matlab_parser.parser import MatlabParsingBudgetException
+
+_INPUT = '''a = 1;
+b = [1 2; 3 4];
+c = foo(a, b) + bar(a) * 2;
+'''
+
+def test_step_budget_exceeded():
+    MatlabParser().parse_string(_INPUT)
+    parse = ParserElement.__dict__['_parse']
+    parser = MatlabParser(budget=ParseBudget(steps=50))
+    with pytest.raises(MatlabParsingBudgetException) as err:
+        parser.parse_string(_INPUT, fail_soft=True)
+    assert err.value.reason == 'steps'
+    assert err.value.line >= 1 and err.value.col >= 1
+    assert ParserElement.__dict__['_parse'] is parse
+
+
+def test_generous_budget():
+    budget = ParseBudget(seconds=600, steps=10**8)
+    context = MatlabParser(budget=budget).parse_string(_INPUT)
+    plain = MatlabParser().parse_string(_INPUT)
+    assert repr(context.nodes) == repr(plain.nodes)
+
+
+def test_budget_is_per_parse():
+    parser = MatlabParser(budget=ParseBudget(steps=10**6))
+    parser.parse_string(_INPUT)
+    steps = parser._meter.steps
+    parser.parse_string(_INPUT)
+    assert parser._meter.steps == steps
+
+
+def test_budget_line_in_pieces():
+    # With a memo, statements are parsed one at a time, but the line
+    # reported is still a line of the whole input.
+    text = 'a = 1;\n' * 3 + 'c = foo(a, b) + bar(a) * 2 - baz(a, b, c);\n'
+    memo = StatementMemo()
+    MatlabParser(memo=memo).parse_string('a = 1;\n')
+    parser = MatlabParser(memo=memo, budget=ParseBudget(steps=100))
+    with pytest.raises(MatlabParsingBudgetException) as err:
+        parser.parse_string(text)
+    assert err.value.line == 4
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser, ParseCache
+
+_INPUT = '''
+a = 1;
+b = [a 2 3];
+function y = f(x)
+  y = x + b(2);
+end
+'''
+
+def nodes_repr(context):
+    return [repr(node) for node in context.nodes]
+
+
+def test_cache_hit_returns_same_result(tmpdir):
+    cache = ParseCache(str(tmpdir))
+    parser = MatlabParser(cache=cache)
+    first = parser.parse_string(_INPUT)
+    assert (cache.hits, cache.misses) == (0, 1)
+    second = parser.parse_string(_INPUT)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert nodes_repr(first) == nodes_repr(second)
+    assert list(second.functions.keys()) == list(first.functions.keys())
+
+
+def test_cache_is_content_addressed(tmpdir):
+    cache = ParseCache(str(tmpdir))
+    parser = MatlabParser(cache=cache)
+    parser.parse_string(_INPUT)
+    parser.parse_string(_INPUT + 'c = 3;\n')
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert len(cache) == 2
+
+
+def test_cache_eviction(tmpdir):
+    cache = ParseCache(str(tmpdir), max_entries=2)
+    parser = MatlabParser(cache=cache)
+    for i in range(4):
+        parser.parse_string('x = {};\n'.format(i))
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.grammar_utils import PredictiveOr
+from pyparsing import Literal, Or, ParseException, Word, ZeroOrMore, alphas
+
+_INPUT = '''% leading comment
+!ls -l
+x = 1, y = 2;
+function r = g(a)
+  % inside
+  r = a';
+end
+'''
+
+def test_predictive_or_matches_like_or():
+    word = Word(alphas)('word')
+    semi = Literal(';')('semi')
+    text = 'abc ; de\n;'
+    plain = ZeroOrMore(Or([word, semi])).parseString(text).asList()
+    predictive = ZeroOrMore(PredictiveOr([(word, alphas),
+                                          (semi, ';')])).parseString(text)
+    assert predictive.asList() == plain
+
+
+def test_predictive_or_no_candidates():
+    expr = PredictiveOr([(Literal('a'), 'a')])
+    with pytest.raises(ParseException):
+        expr.parseString('b')
+
+
+def test_statements_parse():
+    context = MatlabParser().parse_string(_INPUT)
+    assert [type(node).__name__ for node in context.nodes] \
+        == ['Comment', 'ShellCommand', 'Assignment', 'Assignment', 'FunDef']
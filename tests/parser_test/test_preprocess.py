@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.grammar_utils import preprocess
+
+
+def test_continuations():
+    assert preprocess('a = [1 2 ...\n 3];\n')[0] == 'a = [1 2   3];\n'
+    assert preprocess('y = 1 ... comment\r\n+ 2\r\n')[0] == 'y = 1  + 2\n'
+    assert preprocess("a = b'...\n+c'\n")[0] == "a = b' +c'\n"
+
+
+def test_no_continuations():
+    for text in ["x = 'a...b';\n", '% c ...\nx=1\n', '!ls ...\nx=1\n',
+                 '%{\nblock...\n%}\n', 's = "q...q";\n']:
+        assert preprocess(text)[0] == text
+
+
+def test_offsets():
+    text = '\tx = [1 ...\r\n\t2];\r\n'
+    new, offsets = preprocess(text)
+    assert new == '        x = [1          2];\n'
+    for pos, char in enumerate(new):
+        if char not in ' \n':
+            assert text[offsets.original(pos)] == char
+
+
+def test_error_position(capsys):
+    text = 'x = [1 ...\n  2];\ny = 3 ...\n  + 4;\nz = (\n'
+    assert MatlabParser().parse_string(text, fail_soft=True) is None
+    assert '(line:5' in capsys.readouterr().out
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.parser import MatlabParsingException
+
+_INPUT = '''% model
+x0 = [1; 2];
+[t, y] = ode45(@f, [0 10], x0);
+
+function dy = f(t, y)
+  k = rates(2);
+  dy = -k * y;
+end
+
+function k = rates(n)
+  k = ones(1, n);
+end
+'''
+
+def summary(context):
+    return ([repr(node) for node in context.nodes], repr(context.name),
+            sorted(repr(name) for name in context.functions),
+            sorted(repr(name) for name in context.calls),
+            sorted(repr(name) for name in context.assignments))
+
+
+def test_reparse_matches_parse():
+    edited = _INPUT.replace('  k = rates(2);\n', '  k = rates(3);\n  m = 4;\n')
+    parser = MatlabParser()
+    first = parser.reparse(None, _INPUT)
+    assert summary(first) == summary(MatlabParser().parse_string(_INPUT))
+    second = parser.reparse(first, edited)
+    assert summary(second) == summary(MatlabParser().parse_string(edited))
+    fun = second.functions[second.nodes[-1].name]
+    assert fun.parent is second
+
+
+def test_reparse_only_changed_statements():
+    parser = MatlabParser()
+    first = parser.reparse(None, _INPUT)
+    edited = _INPUT.replace('dy = -k * y;', 'dy = -2 * k * y;')
+    added = set(parser.reparse(first, edited).chunks[1]) - set(first.chunks[1])
+    # The statement, and the function that contains it.
+    assert len(added) == 2
+    assert '  dy = -2 * k * y;\n' in added
+
+
+def test_reparse_leaves_old_context_alone():
+    parser = MatlabParser()
+    first = parser.reparse(None, _INPUT)
+    before = summary(first)
+    parser.reparse(first, _INPUT.replace('ones', 'zeros'))
+    assert summary(first) == before
+
+
+def test_reparse_error_line():
+    parser = MatlabParser()
+    first = parser.reparse(None, _INPUT)
+    with pytest.raises(MatlabParsingException) as err:
+        parser.reparse(first, _INPUT.replace('ones(1, n);', 'ones(1, n) +;'))
+    assert 'line 11' in str(err.value)
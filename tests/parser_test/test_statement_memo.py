@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser, StatementMemo
+
+_FIRST = '''tspan = [0 300];
+x0 = [1; 2];
+[t, y] = ode45(@f, tspan, x0);
+figure; hold on;
+'''
+
+_SECOND = '''% another model
+tspan = [0 300];
+    x0 = [1; 2];
+'''
+
+def nodes_repr(context):
+    return [repr(node) for node in context.nodes]
+
+
+def test_memo_shared_between_files():
+    memo = StatementMemo()
+    MatlabParser(memo=memo).parse_string(_FIRST)
+    assert (memo.hits, memo.misses) == (0, 4)
+    second = MatlabParser(memo=memo).parse_string(_SECOND)
+    # Indentation does not matter.
+    assert (memo.hits, memo.misses) == (2, 5)
+    assert nodes_repr(second) == nodes_repr(MatlabParser().parse_string(_SECOND))
+
+
+def test_memo_results_not_modified():
+    memo = StatementMemo()
+    text = 'function y = f(x)\n  y = g(x);\nend\nfunction z = g(w)\n  z = w;\nend\n'
+    first = MatlabParser(memo=memo).parse_string(text)
+    second = MatlabParser(memo=memo).parse_string(text)
+    assert memo.misses > 0 and memo.hits == memo.misses
+    assert nodes_repr(first) == nodes_repr(second)
+    assert nodes_repr(first) == nodes_repr(MatlabParser().parse_string(text))
+
+
+def test_memo_lru_bound():
+    memo = StatementMemo(max_entries=2)
+    MatlabParser(memo=memo).parse_string(_FIRST)
+    assert len(memo) == 2
+
+
+def test_memo_parse_error(capsys):
+    text = 'a = 1;\nb = (2;\n'
+    assert MatlabParser().parse_string(text, fail_soft=True) is None
+    plain = capsys.readouterr().out
+    assert MatlabParser(memo=StatementMemo()).parse_string(text, fail_soft=True) is None
+    assert capsys.readouterr().out == plain
+
+
+def test_memo_tabs_after_indentation():
+    # Tabs are expanded by column, so the indentation matters here.
+    first = 'function g()\n%\tnote\nend\n'
+    second = 'function f()\n  %\tnote\n  x = 1;\nend\n'
+    memo = StatementMemo()
+    MatlabParser(memo=memo).parse_string(first)
+    shared = MatlabParser(memo=memo).parse_string(second)
+    assert nodes_repr(shared) == nodes_repr(MatlabParser().parse_string(second))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+from matlab_parser.matlab import Assignment, FunDef, If
+
+_INPUT = '''function r = outer(a)
+  if a > 1
+    r = inner(a);
+  end
+  function s = inner(b)
+    s = b * 2;
+  end
+end
+'''
+
+def test_statements_are_nodes():
+    context = MatlabParser().parse_string(_INPUT)
+    outer = context.nodes[0]
+    assert isinstance(outer, FunDef)
+    assert isinstance(outer.body[0], If)
+    assert isinstance(outer.body[0].body[0], Assignment)
+    assert isinstance(outer.body[1], FunDef)
+
+
+def test_function_contexts():
+    context = MatlabParser().parse_string(_INPUT)
+    outer = context.nodes[0]
+    inner = outer.body[1]
+    assert context.name == outer.name
+    assert list(context.functions.values()) == [outer.context]
+    assert outer.context.parent is context
+    assert list(outer.context.functions.values()) == [inner.context]
+    assert inner.context.parent is outer.context
+    assert inner.context.nodes == inner.body
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabParser
+
+
+def rhs(text):
+    result = repr(MatlabParser().parse_string('x = ' + text + '\n').nodes[0].rhs)
+    return result.replace('Ambiguous(name=', '').replace(', args=None)', '')
+
+
+def test_numbers():
+    for number in ['1', '12', '1.5', '.5', '1.', '1e5', '1.5E-3', '2d+4',
+                   '1.e2', '.5e1']:
+        assert rhs(number) == "Number(value='{}')".format(number)
+    assert rhs('1.*2') == "BinaryOp(op='*', left=Number(value='1.'), right=Number(value='2'))"
+
+
+def test_keywords_and_identifiers():
+    assert rhs('endx') == "Identifier(name='endx')"
+    assert rhs('if_1 + elseifs') == "BinaryOp(op='+', left=Identifier(name='if_1'), right=Identifier(name='elseifs'))"
+    with pytest.raises(Exception):
+        MatlabParser().parse_string('x = end\n')
+
+
+def test_operators():
+    assert rhs('a .^ b') == "BinaryOp(op='.^', left=Identifier(name='a'), right=Identifier(name='b'))"
+    assert rhs('a ~= b') == "BinaryOp(op='~=', left=Identifier(name='a'), right=Identifier(name='b'))"
+    assert rhs('a <= b') == "BinaryOp(op='<=', left=Identifier(name='a'), right=Identifier(name='b'))"
+    assert rhs('a .\\ b') == "BinaryOp(op='.\\', left=Identifier(name='a'), right=Identifier(name='b'))"
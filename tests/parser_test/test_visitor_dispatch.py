@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser.matlab import BinaryOp, Identifier, MatlabNodeVisitor, \
+    Number, Primitive
+
+class Collector(MatlabNodeVisitor):
+    def __init__(self):
+        super(Collector, self).__init__()
+        self.seen = []
+
+    def visit_Identifier(self, node):
+        self.seen.append(node.name)
+        return node
+
+    def visit_Primitive(self, node):
+        self.seen.append(node.value)
+        return node
+
+
+class Lists(Collector):
+    def visit_list(self, node):
+        self.seen.append(len(node))
+        return self.default_visit_list(node)
+
+
+def test_dispatch():
+    node = BinaryOp(op='+', left=Identifier(name='a'), right=Number(value='1'))
+    collector = Collector()
+    assert collector.visit([node, (Identifier(name='b'), None)]) == \
+        [node, (Identifier(name='b'), None)]
+    assert collector.seen == ['a', '1', 'b']
+
+
+def test_tables_are_per_visitor_class():
+    first, second, lists = Collector(), Collector(), Lists()
+    assert first._methods is second._methods
+    assert lists._methods is not first._methods
+    lists.visit([Identifier(name='a')])
+    assert lists.seen == [1, 'a']
+    first.visit([Identifier(name='a')])
+    assert first.seen == ['a']
+
+
+def test_node_class_defined_later():
+    collector = Collector()
+    collector.visit(Number(value='1'))
+
+    class Imaginary(Primitive):
+        pass
+
+    collector.visit(Imaginary(value='1i'))
+    assert collector.seen == ['1', '1i']